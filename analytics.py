@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def daily_summary(trades_df):
+    # Per-day rows shaped like the daily_pnl rollup, from individual trades
+    pnl = trades_df["net_pnl"].fillna(0)
+    grouped = pnl.groupby(trades_df["date"])
+    return pd.DataFrame({
+        "trade_count": grouped.size(),
+        "win_count": (pnl > 0).groupby(trades_df["date"]).sum(),
+        "gross_pnl": grouped.sum(),
+    }).rename_axis("date").reset_index()
+
+
+def calendar_grid(daily_df, start_date, end_date):
+    # Lays out one cell per day between start_date and end_date as a
+    # weekday x week grid. Returns (pnl, hover text, week start dates);
+    # days without trades are NaN.
+    days = pd.date_range(start_date, end_date, freq="D")
+    daily = daily_df.assign(date=pd.to_datetime(daily_df["date"])).set_index("date")
+    daily = daily.reindex(days)
+
+    offset = np.arange(len(days)) + days[0].weekday()
+    weeks = offset // 7
+    weekday = offset % 7
+    n_weeks = weeks[-1] + 1
+
+    pnl = np.full((7, n_weeks), np.nan)
+    pnl[weekday, weeks] = daily["gross_pnl"].to_numpy(dtype=float)
+
+    count = daily["trade_count"].fillna(0).astype(int)
+    win_rate = (daily["win_count"] / daily["trade_count"] * 100).round(1)
+    label = pd.Series(days.strftime("%Y-%m-%d"), index=days)
+    label = label.where(
+        count == 0,
+        label + "<br>P&L: ₹" + daily["gross_pnl"].round(2).astype(str)
+        + "<br>Trades: " + count.astype(str)
+        + "<br>Win rate: " + win_rate.astype(str) + "%"
+    )
+    text = np.full((7, n_weeks), "", dtype=object)
+    text[weekday, weeks] = label.to_numpy()
+
+    week_starts = days[0] - pd.Timedelta(days=days[0].weekday()) + pd.to_timedelta(np.arange(n_weeks) * 7, unit="D")
+    return pnl, text, week_starts
+
+
+# Trade-level performance metrics. Everything below works on whole NumPy
+# columns; the only per-group work is a bincount per tag column.
+TAG_COLUMNS = ["setup_type", "market_condition", "psychology"]
+ANALYTICS_COLUMNS = ["date", "net_pnl", "entry_price", "stop_loss", "qty"] + TAG_COLUMNS
+
+
+def prepare_trades(trades_df):
+    # Expects trades ordered by (date, id); parses dates and turns the tag
+    # columns into categoricals so the metrics never touch Python strings
+    df = trades_df.copy()
+    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d")
+    for column in TAG_COLUMNS:
+        df[column] = df[column].astype("category")
+    return df
+
+
+def _runs(mask):
+    # (start, end) indices of each run of True values, end exclusive
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
+
+
+def _longest_run(mask):
+    starts, ends = _runs(mask)
+    return int((ends - starts).max()) if len(starts) else 0
+
+
+def rolling_sharpe(daily_pnl, window=20, periods_per_year=252):
+    # Annualized mean/std of daily P&L over a trailing window, via cumulative sums
+    values = np.asarray(daily_pnl, dtype=float)
+    result = np.full(len(values), np.nan)
+    if len(values) < window:
+        return result
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    squares = np.concatenate(([0.0], np.cumsum(values * values)))
+    mean = (sums[window:] - sums[:-window]) / window
+    variance = (squares[window:] - squares[:-window]) / window - mean * mean
+    std = np.sqrt(np.clip(variance * window / (window - 1), 0, None))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result[window - 1:] = np.where(std > 0, mean / std * np.sqrt(periods_per_year), np.nan)
+    return result
+
+
+def tag_breakdown(column, pnl, r_multiple):
+    codes = column.cat.codes.to_numpy()
+    present = codes >= 0
+    codes = codes[present]
+    size = len(column.cat.categories)
+    pnl = pnl[present]
+    r_valid = ~np.isnan(r_multiple[present])
+    count = np.bincount(codes, minlength=size)
+    wins = np.bincount(codes, weights=pnl > 0, minlength=size)
+    total = np.bincount(codes, weights=pnl, minlength=size)
+    r_sum = np.bincount(codes[r_valid], weights=r_multiple[present][r_valid], minlength=size)
+    r_count = np.bincount(codes[r_valid], minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        breakdown = pd.DataFrame({
+            column.name: column.cat.categories,
+            "trades": count,
+            "win_rate": wins / count * 100,
+            "total_pnl": total,
+            "avg_pnl": total / count,
+            "avg_r": r_sum / r_count,
+        })
+    return breakdown[breakdown["trades"] > 0].sort_values("total_pnl", ascending=False, ignore_index=True)
+
+
+def trade_metrics(df, sharpe_window=20, periods_per_year=252):
+    # `df` comes from prepare_trades
+    pnl = df["net_pnl"].to_numpy(dtype=float, na_value=0.0)
+    dates = df["date"].to_numpy()
+    n = len(pnl)
+
+    equity = np.cumsum(pnl)
+    # Drawdowns are measured from the running peak, starting from flat (0)
+    peak = np.maximum.accumulate(np.maximum(equity, 0.0))
+    drawdown = equity - peak
+    starts, ends = _runs(drawdown < 0)
+    max_dd_trades = 0
+    max_dd_days = 0
+    if len(starts):
+        lengths = ends - starts
+        longest = int(lengths.argmax())
+        max_dd_trades = int(lengths[longest])
+        # From the last peak before the run to the trade that recovered it
+        # (or the latest trade if it has not recovered yet)
+        peak_date = dates[max(starts[longest] - 1, 0)]
+        recovery_date = dates[min(ends[longest], n - 1)]
+        max_dd_days = int((recovery_date - peak_date) // np.timedelta64(1, "D"))
+
+    wins = pnl > 0
+    losses = pnl < 0
+    gross_profit = pnl[wins].sum()
+    gross_loss = -pnl[losses].sum()
+    win_count = int(wins.sum())
+    loss_count = int(losses.sum())
+
+    risk = np.abs(df["entry_price"].to_numpy(dtype=float, na_value=np.nan)
+                  - df["stop_loss"].to_numpy(dtype=float, na_value=np.nan)) \
+        * df["qty"].to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_multiple = np.where(risk > 0, pnl / risk, np.nan)
+
+    # Daily P&L from day boundaries in the date-ordered column
+    day_starts = np.flatnonzero(np.concatenate(([True], dates[1:] != dates[:-1]))) if n else np.array([], dtype=int)
+    daily_pnl = np.add.reduceat(pnl, day_starts) if n else np.array([])
+    sharpe = rolling_sharpe(daily_pnl, sharpe_window, periods_per_year)
+
+    summary = {
+        "trades": n,
+        "win_rate": win_count / n * 100 if n else 0.0,
+        "total_pnl": float(equity[-1]) if n else 0.0,
+        "expectancy": float(pnl.mean()) if n else 0.0,
+        "avg_win": float(gross_profit / win_count) if win_count else 0.0,
+        "avg_loss": float(-gross_loss / loss_count) if loss_count else 0.0,
+        "profit_factor": float(gross_profit / gross_loss) if gross_loss else float("inf"),
+        "max_drawdown": float(drawdown.min()) if n else 0.0,
+        "max_drawdown_trades": max_dd_trades,
+        "max_drawdown_days": max_dd_days,
+        "longest_win_streak": _longest_run(wins),
+        "longest_loss_streak": _longest_run(losses),
+        "avg_r": float(np.nanmean(r_multiple)) if np.isfinite(r_multiple).any() else float("nan"),
+        "sharpe": float(sharpe[-1]) if len(sharpe) else float("nan"),
+    }
+    return {
+        "summary": summary,
+        "equity": equity,
+        "drawdown": drawdown,
+        "r_multiple": r_multiple,
+        "daily": pd.DataFrame({"date": dates[day_starts], "pnl": daily_pnl, "rolling_sharpe": sharpe}),
+        "breakdowns": {column: tag_breakdown(df[column], pnl, r_multiple) for column in TAG_COLUMNS},
+    }
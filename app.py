@@ -1,179 +1,56 @@
+import time
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
+import numpy as np
 from datetime import datetime
-import plotly.express as px
-import base64
-import sqlite3
-import os
-from openpyxl import Workbook
-from openpyxl.drawing.image import Image as ExcelImage
-import calendar
-from fpdf import FPDF
-from PIL import Image as PILImage
-import io
-import hashlib
-
-# Database configuration
-DATABASE_URI = 'sqlite:///trading_data.db'
-conn = sqlite3.connect("trading_data.db", check_same_thread=False)
-c = conn.cursor()
-
-# Create tables
-c.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE,
-    password TEXT,
-    is_owner BOOLEAN DEFAULT FALSE
+import plotly.graph_objects as go
+from analytics import TAG_COLUMNS, daily_summary
+from archive import ARCHIVE_AFTER_DAYS, archive_all, cutoff_date
+from auth import authenticate, create_user, fetch_user_page, user_count
+from charts import calendar_figure, histogram_figure, line_figure
+from db import get_engine, migrate, session
+from jobs import ACTIVE, MAX_ACTIVE_PER_USER, cancel_job, export_cache_stats, get_job, submit_export
+from images import UPLOAD_TYPES, prepare_upload, store_image
+from importer import import_trades
+from trades import (
+    fetch_trade_page, fetch_trade_images, fetch_trade_thumbnails, load_trades, load_daily_pnl, pnl_summary, trade_date_bounds,
+    load_pnl_values, load_trade_metrics, load_open_options, insert_trade, update_trade, delete_trade
 )
-""")
-
-c.execute("""
-CREATE TABLE IF NOT EXISTS trades (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    date TEXT,
-    symbol TEXT,
-    trade_type TEXT,
-    entry_price REAL,
-    exit_price REAL,
-    stop_loss REAL,
-    target REAL,
-    qty INTEGER,
-    status TEXT,
-    setup_type TEXT,
-    market_condition TEXT,
-    psychology TEXT,
-    notes TEXT,
-    entry_screenshot BLOB,
-    exit_screenshot BLOB,
-    net_pnl REAL,
-    FOREIGN KEY(user_id) REFERENCES users(id)
-)
-""")
-conn.commit()
+from query_cache import cache_stats
+from perf import maybe_dump, prometheus_text, record_rerun, reset as reset_perf, series_summary, slowest_queries, slowest_sessions, start_metrics_server, timer
+from sizing import parse_values, position_sizes, scenario_matrix
+from options import OPTION_TYPES, implied_volatility, payoff_grid, portfolio_greeks, price_grid, years_to_expiry
+
+rerun_started = time.perf_counter()
+start_metrics_server()
+
+# Create tables / apply pending schema migrations once per process rather
+# than on every rerun; the cached engine keeps its connection pool with it
+@st.cache_resource
+def init_database():
+    with session() as conn:
+        migrate(conn)
+    return get_engine()
+
+init_database()
 
 # Utility functions
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password, hashed_password):
-    return hash_password(password) == hashed_password
-
-def calculate_position_size(capital, risk_percent, entry, stop_loss, position_type):
-    risk_amount = capital * (risk_percent / 100)
-    risk_per_share = abs(entry - stop_loss)
-    return round(risk_amount / risk_per_share) if risk_per_share != 0 else 0
-
-def get_image_base64(image_file):
-    if image_file is not None:
-        return base64.b64encode(image_file.read()).decode()
-    return None
-
-def save_to_excel(trades_df, period, start_date, end_date, user_id):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Trade Journal"
-    headers = ["Date", "Symbol", "Type", "Entry", "Exit", "Qty", "Status", "Notes"]
-    ws.append(headers)
-    
-    # Create a directory to store screenshots
-    screenshot_dir = f"screenshots_user_{user_id}_{period}_{start_date}_{end_date}"
-    os.makedirs(screenshot_dir, exist_ok=True)
-    
-    for index, row in trades_df.iterrows():
-        # Save screenshots as images
-        if row['entry_screenshot']:
-            entry_screenshot_path = os.path.join(screenshot_dir, f"entry_{index}.png")
-            with open(entry_screenshot_path, "wb") as f:
-                f.write(base64.b64decode(row['entry_screenshot']))
-        
-        if row['exit_screenshot']:
-            exit_screenshot_path = os.path.join(screenshot_dir, f"exit_{index}.png")
-            with open(exit_screenshot_path, "wb") as f:
-                f.write(base64.b64decode(row['exit_screenshot']))
-        
-        # Add trade data to the Excel file
-        ws.append([
-            row['date'], row['symbol'], row['trade_type'],
-            row['entry_price'], row['exit_price'], row['qty'],
-            row['status'], row['notes']
-        ])
-    
-    excel_file = f"trade_journal_user_{user_id}_{period}_{start_date}_{end_date}.xlsx"
-    wb.save(excel_file)
-    return excel_file, screenshot_dir
-
-def save_to_pdf(trades_df, user_id):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    
-    # Add a title
-    pdf.cell(200, 10, txt="Trade Journal", ln=True, align="C")
-    pdf.ln(10)
-    
-    # Add trade details
-    for _, row in trades_df.iterrows():
-        pdf.cell(200, 10, txt=f"Date: {row['date']}", ln=True)
-        pdf.cell(200, 10, txt=f"Symbol: {row['symbol']}", ln=True)
-        pdf.cell(200, 10, txt=f"Type: {row['trade_type']}", ln=True)
-        pdf.cell(200, 10, txt=f"Entry: {row['entry_price']}", ln=True)
-        pdf.cell(200, 10, txt=f"Exit: {row['exit_price']}", ln=True)
-        pdf.cell(200, 10, txt=f"Qty: {row['qty']}", ln=True)
-        pdf.cell(200, 10, txt=f"Status: {row['status']}", ln=True)
-        pdf.cell(200, 10, txt=f"Notes: {row['notes']}", ln=True)
-        pdf.ln(10)
-        
-        # Add entry screenshot
-        if row['entry_screenshot']:
-            entry_screenshot = io.BytesIO(base64.b64decode(row['entry_screenshot']))
-            img = PILImage.open(entry_screenshot)
-            img_path = f"entry_{row['id']}.png"
-            img.save(img_path)
-            pdf.image(img_path, x=10, y=pdf.get_y(), w=100)
-            pdf.ln(80)
-            os.remove(img_path)
-        
-        # Add exit screenshot
-        if row['exit_screenshot']:
-            exit_screenshot = io.BytesIO(base64.b64decode(row['exit_screenshot']))
-            img = PILImage.open(exit_screenshot)
-            img_path = f"exit_{row['id']}.png"
-            img.save(img_path)
-            pdf.image(img_path, x=10, y=pdf.get_y(), w=100)
-            pdf.ln(80)
-            os.remove(img_path)
-    
-    pdf_file = f"trade_journal_user_{user_id}.pdf"
-    pdf.output(pdf_file)
-    return pdf_file
+def show_position_outputs(action, entry, stop, target, risk_percent, capital):
+    sizes = position_sizes(entry, stop, target, risk_percent, capital)
+    reward_risk = sizes['reward_risk']
+    st.markdown("### Outputs")
+    st.write(f"**Quantity to {action}:** {int(sizes['qty'])}")
+    st.write(f"**Cost of Position:** ₹{float(sizes['position_cost']):,.2f}")
+    st.write(f"**Trade Risk:** ₹{float(sizes['risk_budget']):,.2f}")
+    if np.isnan(reward_risk):
+        st.warning("Stop price equals entry price; reward/risk is undefined")
+    else:
+        st.write(f"**Reward/Risk Ratio:** {float(reward_risk):.2f}")
 
 # Function to generate calendar view
-def generate_calendar_view(trades_df, year, month):
-    cal = calendar.monthcalendar(year, month)
-    month_name = calendar.month_name[month]
-    st.subheader(f"📅 {month_name} {year} - Trade Calendar")
-    
-    # Create a DataFrame for the calendar
-    calendar_df = pd.DataFrame(cal, columns=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
-    calendar_df = calendar_df.replace(0, "")  # Replace 0s with empty strings
-    
-    # Add trade data to the calendar
-    for index, row in trades_df.iterrows():
-        trade_date = datetime.strptime(row['date'], "%Y-%m-%d").date()
-        if trade_date.year == year and trade_date.month == month:
-            day = trade_date.day
-            for i, week in enumerate(cal):
-                if day in week:
-                    row_idx = i
-                    col_idx = week.index(day)
-                    pnl = row['net_pnl']
-                    color = "green" if pnl > 0 else "red"
-                    calendar_df.iloc[row_idx, col_idx] = f"<span style='color: {color};'>{day}</span>"
-    
-    # Display the calendar
-    st.markdown(calendar_df.to_html(escape=False), unsafe_allow_html=True)
+def generate_calendar_view(daily_df, start_date, end_date):
+    st.plotly_chart(calendar_figure(daily_df, start_date, end_date), use_container_width=True)
 
 # Main app
 st.set_page_config(page_title="Professional Trading Journal", layout="wide")
@@ -185,12 +62,11 @@ if 'logged_in' not in st.session_state:
     st.session_state.is_owner = False
 
 def login(username, password):
-    c.execute("SELECT id, password, is_owner FROM users WHERE username = ?", (username,))
-    user = c.fetchone()
-    if user and verify_password(password, user[1]):
+    with session() as conn:
+        user = authenticate(conn, username, password)
+    if user:
         st.session_state.logged_in = True
-        st.session_state.user_id = user[0]
-        st.session_state.is_owner = user[2]
+        st.session_state.user_id, st.session_state.is_owner = user
         return True
     return False
 
@@ -200,13 +76,579 @@ def logout():
     st.session_state.is_owner = False
 
 def register(username, password, is_owner=False):
-    hashed_password = hash_password(password)
-    try:
-        c.execute("INSERT INTO users (username, password, is_owner) VALUES (?, ?, ?)", (username, hashed_password, is_owner))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
+    with session() as conn:
+        return create_user(conn, username, password, is_owner)
+
+# Background exports (see jobs.py)
+def queue_export(label, file_stem, export_format, start, end, search="", **options):
+    job = submit_export(
+        st.session_state.user_id, export_format,
+        start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), search, **options
+    )
+    if job is None:
+        st.warning(f"You already have {MAX_ACTIVE_PER_USER} exports running. Wait for one to finish or cancel it.")
+        return
+    st.session_state.setdefault("export_jobs", {})[label] = (job.id, file_stem)
+
+def session_export_jobs():
+    # [(label, file stem, job)] for this session, forgetting jobs the queue dropped
+    jobs = []
+    for label, (job_id, file_stem) in list(st.session_state.get("export_jobs", {}).items()):
+        job = get_job(job_id, st.session_state.user_id)
+        if job is None:
+            del st.session_state.export_jobs[label]
+        else:
+            jobs.append((label, file_stem, job))
+    return jobs
+
+def render_export_jobs(polling):
+    # Progress, cancel and download buttons for this session's exports
+    running = False
+    for label, file_stem, job in session_export_jobs():
+        if job.status in ACTIVE:
+            running = True
+            progress_col, cancel_col = st.columns([4, 1])
+            progress_col.progress(job.progress, text=f"{label}: {job.status}, {job.rows_done:,} of {job.rows_total:,} trades")
+            cancel_col.button("✖️ Cancel", key=f"cancel_{job.id}", on_click=cancel_job, args=(job.id, job.user_id))
+        elif job.status == "done":
+            data = job.result
+            if data is None:
+                st.caption(f"{label}: the file is no longer cached, export it again")
+            else:
+                st.download_button(
+                    label=f"⬇️ Download {label}",
+                    data=data,
+                    file_name=f"{file_stem}.{job.extension}",
+                    mime=job.mime,
+                    key=f"download_{job.id}"
+                )
+        elif job.status == "failed":
+            st.error(f"{label} failed: {job.error}")
+        else:
+            st.caption(f"{label}: cancelled")
+    # Rerun the whole page once everything has finished so polling stops
+    if polling and not running:
+        st.rerun()
+
+# Trade Journal
+def render_journal():
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        st.subheader("🔍 Filter Trades")
+        start_date = st.date_input("Start Date", datetime.today(), key="history_start")
+        end_date = st.date_input("End Date", datetime.today(), key="history_end")
+        selected_symbol = st.text_input("Search Symbol / Notes", help="Matches word prefixes in symbol, notes, setup and psychology", key="history_search")
+
+    with col2:
+        st.subheader("📜 Trade History")
+        history_filters = (start_date, end_date, selected_symbol)
+        if st.session_state.get("history_filters") != history_filters:
+            st.session_state.history_filters = history_filters
+            st.session_state.history_pages = [None]
+
+        # Only non-empty pages get a next cursor, so an empty page means an empty range
+        with session() as conn:
+            page_df, next_cursor = fetch_trade_page(
+                conn,
+                st.session_state.user_id,
+                start_date.strftime("%Y-%m-%d"),
+                end_date.strftime("%Y-%m-%d"),
+                selected_symbol,
+                after=st.session_state.history_pages[-1]
+            )
+
+        if not page_df.empty:
+            # Download Options
+            st.subheader("📥 Download Options")
+            embed_images = st.checkbox("Embed screenshot thumbnails in Excel", key="embed_images")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.write("**Day-wise Download**")
+                day_start = st.date_input("Start Date (Day-wise)", datetime.today(), key="day_start")
+                day_end = st.date_input("End Date (Day-wise)", datetime.today(), key="day_end")
+                if st.button("Download Day-wise"):
+                    queue_export("Day-wise Excel", "trade_journal_daywise", "excel", day_start, day_end, embed_images=embed_images)
+            with col2:
+                st.write("**Month-wise Download**")
+                month_start = st.date_input("Start Date (Month-wise)", datetime.today(), key="month_start")
+                month_end = st.date_input("End Date (Month-wise)", datetime.today(), key="month_end")
+                if st.button("Download Month-wise"):
+                    queue_export("Month-wise Excel", "trade_journal_monthwise", "excel", month_start, month_end, embed_images=embed_images)
+            with col3:
+                st.write("**Year-wise Download**")
+                year_start = st.date_input("Start Date (Year-wise)", datetime.today(), key="year_start")
+                year_end = st.date_input("End Date (Year-wise)", datetime.today(), key="year_end")
+                if st.button("Download Year-wise"):
+                    queue_export("Year-wise Excel", "trade_journal_yearwise", "excel", year_start, year_end, embed_images=embed_images)
+
+            # PDF Export (same filters as the history)
+            pdf_summaries = st.checkbox("Per-day summaries in PDF", key="pdf_summaries")
+            if st.button("Download PDF"):
+                queue_export("PDF", "trade_journal", "pdf", start_date, end_date, selected_symbol, daily_summaries=pdf_summaries)
+
+            # Exports run in the background; this polls only while one is in flight
+            exports_running = any(job.status in ACTIVE for _, _, job in session_export_jobs())
+            st.fragment(render_export_jobs, run_every=1 if exports_running else None)(exports_running)
+
+            # Calendar View
+            st.subheader("📅 Trade Calendar")
+            with session() as conn:
+                first_date, last_date = trade_date_bounds(conn, st.session_state.user_id)
+            years = list(range(int(last_date[:4]), int(first_date[:4]) - 1, -1))
+            selected_year = st.selectbox("Select Year", years, key="calendar_year")
+            calendar_start, calendar_end = f"{selected_year}-01-01", f"{selected_year}-12-31"
+            with session() as conn:
+                if selected_symbol:
+                    # The rollup has no symbol dimension, so searches group the matching trades
+                    calendar_df = daily_summary(load_trades(
+                        conn, st.session_state.user_id, calendar_start, calendar_end,
+                        selected_symbol, columns=["date", "net_pnl"]
+                    ))
+                else:
+                    calendar_df = load_daily_pnl(conn, st.session_state.user_id, calendar_start, calendar_end)
+            generate_calendar_view(calendar_df, calendar_start, calendar_end)
+
+            # Trade History Table (one page at a time, newest first)
+            for _, trade in page_df.iterrows():
+                with st.expander(f"{trade['symbol']} - {trade['date']} - {trade['status']}"):
+                    cols = st.columns([3,1])
+                    with cols[0]:
+                        st.write(f"**Entry:** ₹{trade['entry_price']} | **Exit:** ₹{trade['exit_price']}")
+                        st.write(f"**Qty:** {trade['qty']}")
+                        if pd.notna(trade['option_type']):
+                            iv_text = "" if pd.isna(trade['implied_vol']) else f" | **IV:** {trade['implied_vol'] * 100:.1f}%"
+                            st.write(f"**{trade['option_type']}** {trade['strike']:g} exp {trade['expiry']}{iv_text}")
+                        st.write(f"**Net P&L:** ₹{trade['net_pnl']:,.2f}")
+                        st.write(f"**Notes:** {trade['notes'] if pd.notna(trade['notes']) else ''}")
+                    with cols[1]:
+                        # Thumbnails are only fetched once the user asks for them,
+                        # full-size images only when asked again
+                        if st.toggle("🖼️ Screenshots", key=f"shots_{trade['id']}"):
+                            with session() as conn:
+                                thumbnails = fetch_trade_thumbnails(
+                                    conn, int(trade['id']), st.session_state.user_id, trade['date']
+                                )
+                            for thumbnail in thumbnails:
+                                if thumbnail:
+                                    st.image(thumbnail, use_container_width=True)
+                            if any(thumbnails) and st.toggle("🔍 Full size", key=f"full_{trade['id']}"):
+                                with session() as conn:
+                                    entry_image, exit_image = fetch_trade_images(
+                                        conn, int(trade['id']), st.session_state.user_id, trade['date']
+                                    )
+                                if entry_image:
+                                    st.image(entry_image, use_container_width=True)
+                                if exit_image:
+                                    st.image(exit_image, use_container_width=True)
+                        if trade['archived']:
+                            st.caption("🗄️ Archived (read-only)")
+                        else:
+                            st.button("✏️ Edit", key=f"edit_{trade['id']}", on_click=start_edit, args=(trade,))
+                            if st.button("🗑️ Delete", key=f"delete_{trade['id']}"):
+                                with session() as conn:
+                                    delete_trade(conn.cursor(), int(trade['id']))
+                                st.rerun()
+
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("⬅️ Newer", disabled=len(st.session_state.history_pages) == 1):
+                    st.session_state.history_pages.pop()
+                    st.rerun()
+            with page_col:
+                st.caption(f"Page {len(st.session_state.history_pages)}")
+            with next_col:
+                if st.button("Older ➡️", disabled=next_cursor is None):
+                    st.session_state.history_pages.append(next_cursor)
+                    st.rerun()
+        else:
+            st.info("No trades found for selected filters")
+
+# Position Calculator; a fragment, so its widgets rerun only this function
+@st.fragment
+def render_calculator():
+    st.subheader("📐 Position Size Calculator")
+
+    # Long Positions
+    st.markdown("### Long Positions")
+    col1, col2 = st.columns(2)
+    with col1:
+        long_entry = st.number_input("Entry Price (₹)", value=100.0, key="long_entry")
+        long_stop = st.number_input("Stop Price (₹)", value=80.0, key="long_stop")
+        long_target = st.number_input("Target Price (₹)", value=150.0, key="long_target")
+    with col2:
+        long_risk = st.number_input("Percent Risk (%)", value=2.0, key="long_risk")
+        long_capital = st.number_input("Account Size (₹)", value=100000.0, key="long_capital")
+
+    if st.button("Calculate Long"):
+        show_position_outputs("Buy", long_entry, long_stop, long_target, long_risk, long_capital)
+
+    st.markdown("---")
+
+    # Short Positions
+    st.markdown("### Short Positions")
+    col3, col4 = st.columns(2)
+    with col3:
+        short_entry = st.number_input("Entry Price (₹)", value=200.0, key="short_entry")
+        short_stop = st.number_input("Stop Price (₹)", value=220.0, key="short_stop")
+        short_target = st.number_input("Target Price (₹)", value=140.0, key="short_target")
+    with col4:
+        short_risk = st.number_input("Percent Risk (%)", value=2.0, key="short_risk")
+        short_capital = st.number_input("Account Size (₹)", value=50000.0, key="short_capital")
+
+    if st.button("Calculate Short"):
+        show_position_outputs("Sell", short_entry, short_stop, short_target, short_risk, short_capital)
+
+    st.markdown("---")
+
+    # Watchlist scenarios: every symbol x risk % x account size in one pass
+    st.markdown("### Watchlist Scenarios")
+    st.caption("Upload a CSV with symbol, entry, stop and target columns or edit the table below. "
+               "Risk and account size accept lists (1, 1.5, 2) or ranges (start:stop:step).")
+    watchlist_file = st.file_uploader("Watchlist CSV", type=["csv"], key="watchlist_file")
+    if watchlist_file is not None:
+        watchlist = pd.read_csv(watchlist_file)
+        watchlist.columns = [str(c).strip().lower() for c in watchlist.columns]
+    else:
+        watchlist = pd.DataFrame({
+            "symbol": ["NIFTY", "BANKNIFTY"],
+            "entry": [100.0, 200.0],
+            "stop": [80.0, 220.0],
+            "target": [150.0, 140.0],
+        })
+    watchlist = st.data_editor(watchlist, num_rows="dynamic", key="watchlist_editor")
+    col1, col2 = st.columns(2)
+    with col1:
+        risk_values = st.text_input("Percent Risk (%)", value="1, 2", key="scenario_risk")
+    with col2:
+        capital_values = st.text_input("Account Size (₹)", value="100000", key="scenario_capital")
+
+    if st.button("Size Watchlist"):
+        missing = {"symbol", "entry", "stop", "target"} - set(watchlist.columns)
+        if missing:
+            st.error(f"Watchlist is missing columns: {', '.join(sorted(missing))}")
+        else:
+            try:
+                st.session_state.scenarios = scenario_matrix(
+                    watchlist.dropna(subset=["entry", "stop", "target"]),
+                    parse_values(risk_values), parse_values(capital_values)
+                )
+            except ValueError as e:
+                st.error(f"Invalid input: {e}")
+
+    scenarios = st.session_state.get('scenarios')
+    if scenarios is not None and len(scenarios):
+        view = st.radio("View", ["Table", "Heatmap"], horizontal=True, key="scenario_view")
+        if view == "Table":
+            st.dataframe(scenarios, hide_index=True, column_config={
+                "position_cost": st.column_config.NumberColumn("Cost of Position", format="₹%.2f"),
+                "risk_budget": st.column_config.NumberColumn("Risk Budget", format="₹%.2f"),
+                "trade_risk": st.column_config.NumberColumn("Trade Risk", format="₹%.2f"),
+                "reward_risk": st.column_config.NumberColumn("Reward/Risk", format="%.2f"),
+            })
+        else:
+            heat_metric = st.selectbox("Metric", ["qty", "position_cost", "trade_risk", "reward_risk"], key="scenario_metric")
+            heat_capital = st.selectbox("Account Size (₹)", sorted(scenarios['capital'].unique()), key="scenario_heat_capital")
+            grid = scenarios[scenarios['capital'] == heat_capital].pivot_table(
+                index='symbol', columns='risk_percent', values=heat_metric, aggfunc='first'
+            )
+            fig = go.Figure(go.Heatmap(
+                z=grid.to_numpy(), x=[f"{r:g}%" for r in grid.columns], y=grid.index,
+                colorscale='Viridis', texttemplate="%{z:,.2f}"
+            ))
+            fig.update_layout(height=max(300, 22 * len(grid)), title=heat_metric.replace('_', ' ').title())
+            st.plotly_chart(fig)
+
+# Analytics
+def render_analytics():
+    import plotly.express as px  # loaded on the first Analytics view, not at startup
+    st.subheader("📊 Performance Analytics")
+    # Metrics and equity curve come from the daily_pnl rollup, not the trades table
+    with session() as conn:
+        summary = pnl_summary(conn, st.session_state.user_id)
+
+    if summary['trade_count']:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            total_trades = summary['trade_count']
+            st.metric("Total Trades", total_trades)
+        with col2:
+            win_rate = (summary['win_count'] / total_trades) * 100
+            st.metric("Win Rate", f"{win_rate:.1f}%")
+        with col3:
+            total_pnl = summary['total_pnl']
+            st.metric("Total P&L", f"₹{total_pnl:,.2f}")
+
+        # Equity Curve
+        with session() as conn:
+            daily_df = load_daily_pnl(conn, st.session_state.user_id)
+        st.plotly_chart(line_figure(pd.to_datetime(daily_df['date']), daily_df['cum_pnl'], 'Equity Curve'))
+
+        # Trade-level metrics
+        with session() as conn:
+            metrics = load_trade_metrics(conn, st.session_state.user_id)
+        stats = metrics['summary']
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Expectancy", f"₹{stats['expectancy']:,.2f}")
+            st.metric("Avg Win / Loss", f"₹{stats['avg_win']:,.0f} / ₹{stats['avg_loss']:,.0f}")
+        with col2:
+            st.metric("Profit Factor", f"{stats['profit_factor']:.2f}")
+            st.metric("Avg R-Multiple", "n/a" if pd.isna(stats['avg_r']) else f"{stats['avg_r']:.2f}R")
+        with col3:
+            st.metric("Max Drawdown", f"₹{stats['max_drawdown']:,.2f}")
+            st.metric("Drawdown Duration", f"{stats['max_drawdown_trades']} trades / {stats['max_drawdown_days']} days")
+        with col4:
+            st.metric("Longest Win Streak", stats['longest_win_streak'])
+            st.metric("Longest Loss Streak", stats['longest_loss_streak'])
+
+        # Drawdown after every trade, downsampled like the equity curve
+        drawdown = metrics['drawdown']
+        st.plotly_chart(line_figure(np.arange(1, len(drawdown) + 1), drawdown, 'Drawdown by Trade', fill='tozeroy'))
+
+        daily_metrics = metrics['daily']
+        if daily_metrics['rolling_sharpe'].notna().any():
+            st.plotly_chart(line_figure(daily_metrics['date'], daily_metrics['rolling_sharpe'], 'Rolling Sharpe (20 trading days)'))
+
+        # Breakdowns by tag
+        breakdown_by = st.selectbox(
+            "Break down by", TAG_COLUMNS, format_func=lambda c: c.replace('_', ' ').title(), key="breakdown_by"
+        )
+        breakdown = metrics['breakdowns'][breakdown_by]
+        if len(breakdown):
+            st.plotly_chart(px.bar(breakdown, x=breakdown_by, y='total_pnl', title='P&L by ' + breakdown_by.replace('_', ' ').title()))
+            st.dataframe(breakdown.round(2), hide_index=True)
+
+        # Win Rate vs. Loss Rate
+        win_loss_df = pd.DataFrame({
+            'result': ['Win', 'Loss'],
+            'count': [summary['win_count'], total_trades - summary['win_count']]
+        })
+        st.plotly_chart(px.pie(win_loss_df, names='result', values='count', title='Win Rate vs. Loss Rate'))
+
+        # P&L Distribution
+        with session() as conn:
+            pnl_df = load_pnl_values(conn, st.session_state.user_id)
+        st.plotly_chart(histogram_figure(pnl_df['net_pnl'], 'P&L Distribution', x_title='Net P&L'))
+    else:
+        st.info("No data available for analytics")
+
+    # Open option positions: Greeks at current underlying prices and expiry payoff
+    with session() as conn:
+        options_df = load_open_options(conn, st.session_state.user_id)
+    if not options_df.empty:
+        st.subheader("🧾 Options Portfolio")
+        underlyings = sorted(options_df['symbol'].unique())
+        spots_df = st.data_editor(
+            pd.DataFrame({'symbol': underlyings, 'spot': options_df.groupby('symbol')['strike'].median().reindex(underlyings).to_numpy()}),
+            disabled=['symbol'], hide_index=True, key="option_spots"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            rate = st.number_input("Risk-free Rate (%)", value=6.5, key="option_rate") / 100
+        with col2:
+            default_vol = st.number_input("IV for positions without one (%)", value=20.0, min_value=0.1, key="option_default_vol") / 100
+        spots = dict(zip(spots_df['symbol'], spots_df['spot']))
+        positions_df, totals_df = portfolio_greeks(options_df, spots, datetime.today(), rate, default_vol)
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Net Delta", f"{totals_df['delta'].sum():,.2f}")
+        col2.metric("Net Gamma", f"{totals_df['gamma'].sum():,.4f}")
+        col3.metric("Theta / day", f"₹{totals_df['theta'].sum():,.2f}")
+        col4.metric("Vega / vol pt", f"₹{totals_df['vega'].sum():,.2f}")
+        st.dataframe(totals_df.round(4), hide_index=True)
+        st.dataframe(positions_df.drop(columns=['id']).round(4), hide_index=True)
+
+        payoff_symbol = st.selectbox("Payoff at expiry for", underlyings, key="payoff_symbol")
+        grid = price_grid(spots[payoff_symbol])
+        payoff = payoff_grid(options_df[options_df['symbol'] == payoff_symbol], grid)
+        fig = go.Figure(go.Scatter(x=grid, y=payoff, mode='lines', name='P&L at expiry'))
+        fig.add_hline(y=0, line_dash='dot')
+        fig.add_vline(x=spots[payoff_symbol], line_dash='dash', annotation_text='Spot')
+        fig.update_layout(title=f"{payoff_symbol} payoff at expiry", xaxis_title='Underlying price', yaxis_title='P&L (₹)')
+        st.plotly_chart(fig)
+
+# New Trade entry; a fragment rather than a form, so a half-filled entry is
+# in session state and survives switching sections
+@st.fragment
+def render_new_trade():
+    st.subheader("➕ New Trade Entry")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        trade_date = st.date_input("Trade Date", key="new_trade_date")
+        symbol = st.text_input("Symbol", key="new_trade_symbol")
+        trade_type = st.selectbox("Type", ["Long", "Short"], key="new_trade_type")
+        entry_price = st.number_input("Entry Price", key="new_trade_entry")
+        exit_price = st.number_input("Exit Price", key="new_trade_exit")
+        stop_loss = st.number_input("Stop Loss", key="new_trade_stop")
+        target_price = st.number_input("Target Price", key="new_trade_target")
+        qty = st.number_input("Qty", min_value=1, value=1, key="new_trade_qty")  # Added Qty field
+
+    with col2:
+        status = st.selectbox("Status", ["Open", "Closed"], key="new_trade_status")
+        setup_type = st.selectbox("Setup Type", ["Breakout", "Reversal", "Trend"], key="new_trade_setup")
+        market_condition = st.selectbox("Market Condition", ["Bullish", "Bearish", "Sideways"], key="new_trade_market")
+        psychology = st.selectbox("Psychology", ["Confident", "Fearful", "Revenge"], key="new_trade_psychology")
+        entry_screenshot = st.file_uploader("Entry Screenshot", type=UPLOAD_TYPES)
+        exit_screenshot = st.file_uploader("Exit Screenshot", type=UPLOAD_TYPES)
+
+    # Option contracts; entry/exit above are the premiums
+    with st.expander("Option Contract"):
+        ocol1, ocol2 = st.columns(2)
+        with ocol1:
+            instrument = st.selectbox("Instrument", ["Stock/Future"] + OPTION_TYPES, key="new_trade_instrument")
+            strike = st.number_input("Strike Price", min_value=0.0, key="new_trade_strike")
+            expiry = st.date_input("Expiry", value=None, key="new_trade_expiry")
+        with ocol2:
+            implied_vol = st.number_input("Implied Volatility (%)", min_value=0.0, help="Leave at 0 to solve it from the entry premium", key="new_trade_iv")
+            underlying_price = st.number_input("Underlying Price at Entry", min_value=0.0, key="new_trade_underlying")
+
+    notes = st.text_area("Trade Notes", key="new_trade_notes")
+
+    if st.button("Save Trade"):
+        option_fields = {}
+        if instrument in OPTION_TYPES and strike > 0 and expiry is not None:
+            iv = implied_vol / 100 if implied_vol else None
+            if iv is None and underlying_price > 0:
+                solved = implied_volatility(
+                    entry_price, underlying_price, strike,
+                    years_to_expiry([expiry], trade_date)[0], option_type=instrument
+                )
+                iv = None if np.isnan(solved) else float(solved)
+            option_fields = {
+                'strike': strike,
+                'expiry': expiry.strftime("%Y-%m-%d"),
+                'option_type': instrument,
+                'implied_vol': iv,
+            }
+        # Screenshots are validated and re-encoded before the write transaction
+        try:
+            entry_image = prepare_upload(entry_screenshot)
+            exit_image = prepare_upload(exit_screenshot)
+        except ValueError as error:
+            st.error(str(error))
+        else:
+            # net_pnl is derived from the trade type by insert_trade
+            with session() as conn:
+                cursor = conn.cursor()
+                insert_trade(cursor, st.session_state.user_id, {
+                    'date': trade_date.strftime("%Y-%m-%d"),
+                    'symbol': symbol,
+                    'trade_type': trade_type,
+                    'entry_price': entry_price,
+                    'exit_price': exit_price,
+                    'stop_loss': stop_loss,
+                    'target': target_price,
+                    'qty': qty,  # Added Qty field
+                    'status': status,
+                    'setup_type': setup_type,
+                    'market_condition': market_condition,
+                    'psychology': psychology,
+                    'notes': notes,
+                    'entry_screenshot': store_image(cursor, entry_image),
+                    'exit_screenshot': store_image(cursor, exit_image),
+                    **option_fields,
+                })
+            st.success("Trade saved successfully!")
+
+# Settings/New Trade
+def render_settings():
+    render_new_trade()
+
+    # Bulk import from broker exports
+    st.subheader("📤 Bulk Import")
+    import_file = st.file_uploader(
+        "Broker CSV/XLSX export", type=["csv", "xlsx"],
+        help="Needs date, symbol, type (Long/Short or Buy/Sell), entry, exit and qty (or lots and lot size) columns"
+    )
+    import_dayfirst = st.checkbox(
+        "Dates are day-first (DD/MM/YYYY)", value=True, key="import_dayfirst",
+        help="Every date in the file is read in the format of its first date; rows that do not fit are rejected"
+    )
+    if import_file is not None and st.button("Import Trades"):
+        import_progress = st.empty()
+        try:
+            stats = import_trades(
+                st.session_state.user_id, import_file, import_file.name,
+                progress=lambda stats: import_progress.write(f"{stats['read']:,} rows read..."),
+                dayfirst=import_dayfirst
+            )
+        except ValueError as error:
+            st.error(str(error))
+        else:
+            st.success(
+                f"Imported {stats['inserted']:,} trades "
+                f"({stats['duplicates']:,} duplicates skipped, {stats['rejected']:,} invalid rows)"
+            )
+
+    # Edit Trade Modal
+    if 'edit_trade' in st.session_state:
+        trade = st.session_state.edit_trade
+        with st.form("edit_trade_form"):
+            st.subheader("Edit Trade")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                new_entry = st.number_input("Entry Price", value=trade['entry_price'])
+                new_exit = st.number_input("Exit Price", value=trade['exit_price'])
+                new_stop = st.number_input("Stop Loss", value=trade['stop_loss'])
+                new_target = st.number_input("Target", value=trade['target'])
+                new_qty = st.number_input("Qty", value=trade['qty'], min_value=1)  # Added Qty field
+
+            with col2:
+                new_status = st.selectbox("Status", ["Open", "Closed"], index=0 if trade['status'] == "Open" else 1)
+                new_notes = st.text_area("Notes", value=trade['notes'] if pd.notna(trade['notes']) else "")
+
+            if st.form_submit_button("Save Changes"):
+                # Also recomputes net_pnl, so the daily rollup follows the edit
+                with session() as conn:
+                    update_trade(
+                        conn.cursor(),
+                        int(trade['id']),
+                        new_entry,
+                        new_exit,
+                        new_stop,
+                        new_target,
+                        new_qty,  # Added Qty field
+                        new_status,
+                        new_notes
+                    )
+                del st.session_state.edit_trade
+                st.rerun()
+
+# Sections of the user view, in navigation order: label -> (metrics name, renderer)
+SECTIONS = {
+    "📝 Trade Journal": ("journal", render_journal),
+    "🧮 Position Calculator": ("calculator", render_calculator),
+    "📊 Analytics": ("analytics", render_analytics),
+    "⚙️ Settings": ("settings", render_settings),
+}
+SETTINGS_SECTION = "⚙️ Settings"
+# Widget keys to keep while their section is hidden; Streamlit drops the state of
+# widgets that do not render. Uploaders and data editors cannot be set, so they reset.
+SECTION_STATE = {
+    "journal": (
+        "history_start", "history_end", "history_search", "embed_images", "day_start", "day_end",
+        "month_start", "month_end", "year_start", "year_end", "pdf_summaries", "calendar_year",
+    ),
+    "calculator": (
+        "long_entry", "long_stop", "long_target", "long_risk", "long_capital",
+        "short_entry", "short_stop", "short_target", "short_risk", "short_capital",
+        "scenario_risk", "scenario_capital", "scenario_view", "scenario_metric", "scenario_heat_capital",
+    ),
+    "analytics": ("breakdown_by", "option_rate", "option_default_vol", "payoff_symbol"),
+    "settings": (
+        "new_trade_date", "new_trade_symbol", "new_trade_type", "new_trade_entry", "new_trade_exit",
+        "new_trade_stop", "new_trade_target", "new_trade_qty", "new_trade_status", "new_trade_setup",
+        "new_trade_market", "new_trade_psychology", "new_trade_instrument", "new_trade_strike",
+        "new_trade_expiry", "new_trade_iv", "new_trade_underlying", "new_trade_notes", "import_dayfirst",
+    ),
+}
+
+def start_edit(trade):
+    # Runs before the next rerun, so the navigation can still be switched
+    st.session_state.edit_trade = trade
+    st.session_state.active_section = SETTINGS_SECTION
 
 # Login page
 if not st.session_state.logged_in:
@@ -243,311 +685,113 @@ else:
                 else:
                     st.error("Username already exists.")
 
-            # List all users
+            # List users one page at a time with their activity
             st.subheader("User List")
-            users_df = pd.read_sql("SELECT id, username, is_owner FROM users", conn)
-            st.dataframe(users_df)
+            user_search = st.text_input("Search username", help="Matches the start of the username", key="user_search")
+            if st.session_state.get("user_search_applied") != user_search:
+                st.session_state.user_search_applied = user_search
+                st.session_state.user_pages = [None]
+            with session() as conn:
+                total_users = user_count(conn)
+                users_df, next_user = fetch_user_page(conn, user_search, after=st.session_state.user_pages[-1])
+            st.caption(f"{total_users:,} users")
+            st.dataframe(
+                users_df.assign(storage_mb=users_df['screenshot_bytes'] / 1e6).drop(columns=['screenshot_bytes']),
+                hide_index=True,
+                column_config={
+                    "is_owner": st.column_config.CheckboxColumn("Owner"),
+                    "trade_count": st.column_config.NumberColumn("Trades"),
+                    "last_trade": st.column_config.TextColumn("Last Trade"),
+                    "total_pnl": st.column_config.NumberColumn("Total P&L", format="₹%.2f"),
+                    "screenshots": st.column_config.NumberColumn("Screenshots"),
+                    "storage_mb": st.column_config.NumberColumn("Storage (MB)", format="%.2f"),
+                },
+            )
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("⬅️ Previous", disabled=len(st.session_state.user_pages) == 1):
+                    st.session_state.user_pages.pop()
+                    st.rerun()
+            with page_col:
+                st.caption(f"Page {len(st.session_state.user_pages)}")
+            with next_col:
+                if st.button("Next ➡️", disabled=next_user is None):
+                    st.session_state.user_pages.append(next_user)
+                    st.rerun()
+
+            # Cold storage: old closed trades move to Parquet files (see archive.py)
+            st.subheader("🗄️ Archive")
+            archive_days = st.number_input(
+                "Archive closed trades older than (days)", min_value=1, value=ARCHIVE_AFTER_DAYS, step=30
+            )
+            if st.button("Archive old trades"):
+                before_date = cutoff_date(int(archive_days))
+                with st.spinner("Archiving..."):
+                    archived_counts = archive_all(before_date)
+                st.success(f"Archived {sum(archived_counts.values()):,} trades dated before {before_date} for {len(archived_counts)} users")
+
+            # Shared query cache
+            stats = cache_stats()
+            st.caption(
+                f"Query cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries, {stats['bytes'] / 1e6:.1f} MB"
+            )
+            export_stats = export_cache_stats()
+            st.caption(
+                f"Export cache: {export_stats['hits']} hits, {export_stats['misses']} misses, "
+                f"{export_stats['entries']} files, {export_stats['bytes'] / 1e6:.1f} MB"
+            )
+
+            # Performance panel (this process only)
+            st.subheader("⏱️ Performance")
+            slow_queries = pd.DataFrame(slowest_queries(10))
+            if not slow_queries.empty:
+                st.write("**Slowest queries** (total time)")
+                st.dataframe(slow_queries[['sql', 'calls', 'total_ms', 'p95_ms', 'max_ms']].round(2), hide_index=True)
+            slow_sessions = pd.DataFrame(slowest_sessions(10))
+            if not slow_sessions.empty:
+                st.write("**Slowest sessions** (seconds per rerun)")
+                st.dataframe(slow_sessions[['session', 'user_id', 'reruns', 'max', 'last', 'total']].round(3), hide_index=True)
+            timings = pd.DataFrame(series_summary())
+            if not timings.empty:
+                timings = timings[timings['name'] != 'sql_seconds']
+                timings['labels'] = timings['labels'].map(lambda labels: ", ".join(f"{k}={v}" for k, v in labels.items()))
+                st.write("**Timings and sizes** (p50/p95/p99 over the last samples)")
+                st.dataframe(timings[['name', 'labels', 'count', 'p50', 'p95', 'p99', 'max']].sort_values(['name', 'labels']), hide_index=True)
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("⬇️ Prometheus metrics", prometheus_text(), file_name="metrics.prom", mime="text/plain")
+            with col2:
+                if st.button("Reset metrics"):
+                    reset_perf()
 
         else:
             st.title(f"📈 Trading Journal - User {st.session_state.user_id}")
             st.markdown("---")
 
-            # Tabs setup
-            tabs = st.tabs(["📝 Trade Journal", "🧮 Position Calculator", "📊 Analytics", "⚙️ Settings"])
-
-            with tabs[0]:  # Trade Journal
-                col1, col2 = st.columns([1, 2])
-                with col1:
-                    st.subheader("🔍 Filter Trades")
-                    start_date = st.date_input("Start Date", datetime.today())
-                    end_date = st.date_input("End Date", datetime.today())
-                    selected_symbol = st.text_input("Filter by Symbol")
-                
-                with col2:
-                    st.subheader("📜 Trade History")
-                    query = """
-                        SELECT * FROM trades 
-                        WHERE date BETWEEN ? AND ?
-                        AND symbol LIKE ?
-                        AND user_id = ?
-                    """
-                    trades_df = pd.read_sql(query, conn, params=(
-                        start_date.strftime("%Y-%m-%d"),
-                        end_date.strftime("%Y-%m-%d"),
-                        f"%{selected_symbol}%",
-                        st.session_state.user_id
-                    ))
-                    
-                    if not trades_df.empty:
-                        # Download Options
-                        st.subheader("📥 Download Options")
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.write("**Day-wise Download**")
-                            day_start = st.date_input("Start Date (Day-wise)", datetime.today(), key="day_start")
-                            day_end = st.date_input("End Date (Day-wise)", datetime.today(), key="day_end")
-                            if st.button("Download Day-wise"):
-                                excel_file, screenshot_dir = save_to_excel(trades_df, "daywise", day_start, day_end, st.session_state.user_id)
-                                with open(excel_file, "rb") as f:
-                                    st.download_button(
-                                        label="⬇️ Download Day-wise",
-                                        data=f,
-                                        file_name="trade_journal_daywise.xlsx",
-                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                    )
-                        with col2:
-                            st.write("**Month-wise Download**")
-                            month_start = st.date_input("Start Date (Month-wise)", datetime.today(), key="month_start")
-                            month_end = st.date_input("End Date (Month-wise)", datetime.today(), key="month_end")
-                            if st.button("Download Month-wise"):
-                                excel_file, screenshot_dir = save_to_excel(trades_df, "monthwise", month_start, month_end, st.session_state.user_id)
-                                with open(excel_file, "rb") as f:
-                                    st.download_button(
-                                        label="⬇️ Download Month-wise",
-                                        data=f,
-                                        file_name="trade_journal_monthwise.xlsx",
-                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                    )
-                        with col3:
-                            st.write("**Year-wise Download**")
-                            year_start = st.date_input("Start Date (Year-wise)", datetime.today(), key="year_start")
-                            year_end = st.date_input("End Date (Year-wise)", datetime.today(), key="year_end")
-                            if st.button("Download Year-wise"):
-                                excel_file, screenshot_dir = save_to_excel(trades_df, "yearwise", year_start, year_end, st.session_state.user_id)
-                                with open(excel_file, "rb") as f:
-                                    st.download_button(
-                                        label="⬇️ Download Year-wise",
-                                        data=f,
-                                        file_name="trade_journal_yearwise.xlsx",
-                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                    )
-                        
-                        # PDF Export
-                        if st.button("Download PDF"):
-                            pdf_file = save_to_pdf(trades_df, st.session_state.user_id)
-                            with open(pdf_file, "rb") as f:
-                                st.download_button(
-                                    label="⬇️ Download PDF",
-                                    data=f,
-                                    file_name="trade_journal.pdf",
-                                    mime="application/pdf"
-                                )
-                        
-                        # Calendar View
-                        st.subheader("📅 Trade Calendar")
-                        selected_year = st.selectbox("Select Year", [2024, 2025])
-                        selected_month = st.selectbox("Select Month", list(range(1, 13)), format_func=lambda x: calendar.month_name[x])
-                        generate_calendar_view(trades_df, selected_year, selected_month)
-                        
-                        # Trade History Table
-                        for _, trade in trades_df.iterrows():
-                            with st.expander(f"{trade['symbol']} - {trade['date']} - {trade['status']}"):
-                                cols = st.columns([3,1])
-                                with cols[0]:
-                                    st.write(f"**Entry:** ₹{trade['entry_price']} | **Exit:** ₹{trade['exit_price']}")
-                                    st.write(f"**Qty:** {trade['qty']}")
-                                    st.write(f"**Net P&L:** ₹{trade['net_pnl']:,.2f}")
-                                    st.write(f"**Notes:** {trade['notes']}")
-                                with cols[1]:
-                                    if trade['entry_screenshot']:
-                                        st.image(base64.b64decode(trade['entry_screenshot']), use_container_width=True)
-                                    if trade['exit_screenshot']:
-                                        st.image(base64.b64decode(trade['exit_screenshot']), use_container_width=True)
-                                    if st.button("✏️ Edit", key=f"edit_{trade['id']}"):
-                                        st.session_state.edit_trade = trade
-                                    if st.button("🗑️ Delete", key=f"delete_{trade['id']}"):
-                                        c.execute("DELETE FROM trades WHERE id=?", (trade['id'],))
-                                        conn.commit()
-                                        st.rerun()
-                    else:
-                        st.info("No trades found for selected filters")
-
-            with tabs[1]:  # Position Calculator
-                st.subheader("📐 Position Size Calculator")
-                
-                # Long Positions
-                st.markdown("### Long Positions")
-                col1, col2 = st.columns(2)
-                with col1:
-                    long_entry = st.number_input("Entry Price (₹)", value=100.0, key="long_entry")
-                    long_stop = st.number_input("Stop Price (₹)", value=80.0, key="long_stop")
-                    long_target = st.number_input("Target Price (₹)", value=150.0, key="long_target")
-                with col2:
-                    long_risk = st.number_input("Percent Risk (%)", value=2.0, key="long_risk")
-                    long_capital = st.number_input("Account Size (₹)", value=100000.0, key="long_capital")
-                
-                if st.button("Calculate Long"):
-                    position_size = calculate_position_size(long_capital, long_risk, long_entry, long_stop, "Long")
-                    cost_of_position = position_size * long_entry
-                    trade_risk = long_capital * (long_risk / 100)
-                    reward_risk = (long_target - long_entry) / (long_entry - long_stop)
-                    
-                    st.markdown("### Outputs")
-                    st.write(f"**Quantity to Buy:** {position_size}")
-                    st.write(f"**Cost of Position:** ₹{cost_of_position:,.2f}")
-                    st.write(f"**Trade Risk:** ₹{trade_risk:,.2f}")
-                    st.write(f"**Reward/Risk Ratio:** {reward_risk:.2f}")
-
-                st.markdown("---")
-
-                # Short Positions
-                st.markdown("### Short Positions")
-                col3, col4 = st.columns(2)
-                with col3:
-                    short_entry = st.number_input("Entry Price (₹)", value=200.0, key="short_entry")
-                    short_stop = st.number_input("Stop Price (₹)", value=220.0, key="short_stop")
-                    short_target = st.number_input("Target Price (₹)", value=140.0, key="short_target")
-                with col4:
-                    short_risk = st.number_input("Percent Risk (%)", value=2.0, key="short_risk")
-                    short_capital = st.number_input("Account Size (₹)", value=50000.0, key="short_capital")
-                
-                if st.button("Calculate Short"):
-                    position_size = calculate_position_size(short_capital, short_risk, short_entry, short_stop, "Short")
-                    cost_of_position = position_size * short_entry
-                    trade_risk = short_capital * (short_risk / 100)
-                    reward_risk = (short_entry - short_target) / (short_stop - short_entry)
-                    
-                    st.markdown("### Outputs")
-                    st.write(f"**Quantity to Sell:** {position_size}")
-                    st.write(f"**Cost of Position:** ₹{cost_of_position:,.2f}")
-                    st.write(f"**Trade Risk:** ₹{trade_risk:,.2f}")
-                    st.write(f"**Reward/Risk Ratio:** {reward_risk:.2f}")
-
-            with tabs[2]:  # Analytics
-                st.subheader("📊 Performance Analytics")
-                trades_df = pd.read_sql("SELECT * FROM trades WHERE user_id = ?", 
-                                      conn, params=(st.session_state.user_id,))
-                
-                if not trades_df.empty:
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        total_trades = len(trades_df)
-                        st.metric("Total Trades", total_trades)
-                    with col2:
-                        win_rate = (len(trades_df[trades_df['net_pnl'] > 0]) / total_trades) * 100
-                        st.metric("Win Rate", f"{win_rate:.1f}%")
-                    with col3:
-                        total_pnl = trades_df['net_pnl'].sum()
-                        st.metric("Total P&L", f"₹{total_pnl:,.2f}")
-                    
-                    # Equity Curve
-                    st.plotly_chart(px.line(trades_df, x='date', y='net_pnl', title='Equity Curve'))
-                    
-                    # Win Rate vs. Loss Rate
-                    win_loss_df = trades_df.groupby(trades_df['net_pnl'] > 0).size().reset_index(name='count')
-                    win_loss_df['result'] = win_loss_df['net_pnl'].apply(lambda x: 'Win' if x else 'Loss')
-                    st.plotly_chart(px.pie(win_loss_df, names='result', values='count', title='Win Rate vs. Loss Rate'))
-                    
-                    # P&L Distribution
-                    st.plotly_chart(px.histogram(trades_df, x='net_pnl', title='P&L Distribution'))
-                else:
-                    st.info("No data available for analytics")
-
-            with tabs[3]:  # Settings/New Trade
-                st.subheader("➕ New Trade Entry")
-                
-                with st.form("new_trade_form"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        trade_date = st.date_input("Trade Date")
-                        symbol = st.text_input("Symbol")
-                        trade_type = st.selectbox("Type", ["Long", "Short"])
-                        entry_price = st.number_input("Entry Price")
-                        exit_price = st.number_input("Exit Price")
-                        stop_loss = st.number_input("Stop Loss")
-                        target_price = st.number_input("Target Price")
-                        qty = st.number_input("Qty", min_value=1, value=1)  # Added Qty field
-                    
-                    with col2:
-                        status = st.selectbox("Status", ["Open", "Closed"])
-                        setup_type = st.selectbox("Setup Type", ["Breakout", "Reversal", "Trend"])
-                        market_condition = st.selectbox("Market Condition", ["Bullish", "Bearish", "Sideways"])
-                        psychology = st.selectbox("Psychology", ["Confident", "Fearful", "Revenge"])
-                        entry_screenshot = st.file_uploader("Entry Screenshot", type=["png", "jpg", "jpeg"])
-                        exit_screenshot = st.file_uploader("Exit Screenshot", type=["png", "jpg", "jpeg"])
-                    
-                    notes = st.text_area("Trade Notes")
-                    
-                    if st.form_submit_button("Save Trade"):
-                        # Correct P&L calculation based on trade type
-                        if trade_type == "Long":
-                            pnl = (exit_price - entry_price) * qty  # Qty used for P&L calculation
-                        else:  # Short
-                            pnl = (entry_price - exit_price) * qty  # Qty used for P&L calculation
-                        net_pnl = pnl  # No brokerage
-                        
-                        c.execute("""
-                            INSERT INTO trades (
-                                user_id, date, symbol, trade_type, entry_price, exit_price,
-                                stop_loss, target, qty, status, setup_type,
-                                market_condition, psychology, notes, entry_screenshot,
-                                exit_screenshot, net_pnl
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            st.session_state.user_id,
-                            trade_date.strftime("%Y-%m-%d"),
-                            symbol,
-                            trade_type,
-                            entry_price,
-                            exit_price,
-                            stop_loss,
-                            target_price,
-                            qty,  # Added Qty field
-                            status,
-                            setup_type,
-                            market_condition,
-                            psychology,
-                            notes,
-                            get_image_base64(entry_screenshot),
-                            get_image_base64(exit_screenshot),
-                            net_pnl
-                        ))
-                        conn.commit()
-                        st.success("Trade saved successfully!")
-
-                # Edit Trade Modal
-                if 'edit_trade' in st.session_state:
-                    trade = st.session_state.edit_trade
-                    with st.form("edit_trade_form"):
-                        st.subheader("Edit Trade")
-                        
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            new_entry = st.number_input("Entry Price", value=trade['entry_price'])
-                            new_exit = st.number_input("Exit Price", value=trade['exit_price'])
-                            new_stop = st.number_input("Stop Loss", value=trade['stop_loss'])
-                            new_target = st.number_input("Target", value=trade['target'])
-                            new_qty = st.number_input("Qty", value=trade['qty'], min_value=1)  # Added Qty field
-                        
-                        with col2:
-                            new_status = st.selectbox("Status", ["Open", "Closed"], index=0 if trade['status'] == "Open" else 1)
-                            new_notes = st.text_area("Notes", value=trade['notes'])
-                        
-                        if st.form_submit_button("Save Changes"):
-                            c.execute("""
-                                UPDATE trades SET
-                                entry_price = ?,
-                                exit_price = ?,
-                                stop_loss = ?,
-                                target = ?,
-                                qty = ?,
-                                status = ?,
-                                notes = ?
-                                WHERE id = ?
-                            """, (
-                                new_entry,
-                                new_exit,
-                                new_stop,
-                                new_target,
-                                new_qty,  # Added Qty field
-                                new_status,
-                                new_notes,
-                                trade['id']
-                            ))
-                            conn.commit()
-                            del st.session_state.edit_trade
-                            st.rerun()
+            # Only the selected section runs; the others are skipped entirely.
+            # Set through session state (not default=) so start_edit can switch it.
+            if 'active_section' not in st.session_state:
+                st.session_state.active_section = next(iter(SECTIONS))
+            section = st.segmented_control(
+                "Section", list(SECTIONS), required=True, key="active_section", label_visibility="collapsed"
+            )
+            name, render = SECTIONS[section]
+            # Re-assigning a hidden widget's value makes it plain session state, which
+            # survives the rerun; the shown section's widgets keep theirs as usual
+            for other_name, _ in SECTIONS.values():
+                if other_name != name:
+                    for key in SECTION_STATE[other_name]:
+                        if key in st.session_state:
+                            st.session_state[key] = st.session_state[key]
+            with timer("render_seconds", section=name):
+                render()
 
 # Footer
 st.markdown("---")
 st.markdown("© 2025 Trading Journal App. All rights reserved.")
+
+# Reruns that end early (st.rerun, st.stop) are not recorded
+run_context = get_script_run_ctx()
+record_rerun(run_context.session_id if run_context else "bare", st.session_state.user_id, time.perf_counter() - rerun_started)
+maybe_dump()
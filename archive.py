@@ -0,0 +1,417 @@
+import argparse
+import functools
+import os
+import re
+import sys
+from datetime import date, timedelta
+from db import migrate, rollup_suspended, session
+
+# Cold storage for old trades. Closed trades older than a cutoff are moved out
+# of SQLite into one Parquet file per user and year:
+#
+#     ARCHIVE_DIR/user_<id>/<year>.parquet
+#
+# Files are sorted by (date, id) and written in row groups of ROW_GROUP_ROWS,
+# so date filters are pushed down to the row-group statistics and only the
+# needed columns are read from the memory-mapped file. Screenshots stay in the
+# blob store; archived_blobs keeps prune_blobs away from them. daily_pnl is
+# left untouched, so totals, the calendar and the equity curve do not change,
+# and db.rebuild_daily_pnl adds archived trades back in when it recomputes the
+# rollup. Archived trades are read-only. pyarrow is imported on first read or
+# write, so startup and users without an archive never load it.
+#
+# ARCHIVE_DIR: where the Parquet files live (default ./archive)
+# ARCHIVE_AFTER_DAYS: default age cutoff for the CLI and the owner dashboard
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 730))
+ROW_GROUP_ROWS = 10_000
+
+# (column, Arrow type); the schema itself is built on first use, see _schema
+ARCHIVE_FIELDS = [
+    ("id", "int64"),
+    ("user_id", "int64"),
+    ("date", "string"),
+    ("symbol", "string"),
+    ("trade_type", "string"),
+    ("entry_price", "float64"),
+    ("exit_price", "float64"),
+    ("stop_loss", "float64"),
+    ("target", "float64"),
+    ("qty", "int64"),
+    ("status", "string"),
+    ("setup_type", "string"),
+    ("market_condition", "string"),
+    ("psychology", "string"),
+    ("notes", "string"),
+    ("entry_screenshot", "string"),
+    ("exit_screenshot", "string"),
+    ("net_pnl", "float64"),
+    ("strike", "float64"),
+    ("expiry", "string"),
+    ("option_type", "string"),
+    ("implied_vol", "float64"),
+]
+ARCHIVE_COLUMNS = [name for name, _ in ARCHIVE_FIELDS]
+# Same columns as the trades_fts index
+SEARCH_COLUMNS = ["symbol", "notes", "setup_type", "psychology"]
+
+
+@functools.cache
+def _schema():
+    import pyarrow as pa
+    return pa.schema([(name, pa.type_for_alias(alias)) for name, alias in ARCHIVE_FIELDS])
+
+
+def cutoff_date(days=ARCHIVE_AFTER_DAYS):
+    return (date.today() - timedelta(days=days)).isoformat()
+
+
+def _user_dir(user_id, directory=None):
+    return os.path.join(directory or ARCHIVE_DIR, f"user_{int(user_id)}")
+
+
+def _year_path(user_id, year, directory=None):
+    return os.path.join(_user_dir(user_id, directory), f"{year}.parquet")
+
+
+def has_archive(user_id, directory=None):
+    # Cheap check so reads for users without an archive skip it entirely
+    return os.path.isdir(_user_dir(user_id, directory))
+
+
+def archived_user_ids(directory=None):
+    path = directory or ARCHIVE_DIR
+    if not os.path.isdir(path):
+        return []
+    names = (name[len("user_"):] for name in os.listdir(path) if name.startswith("user_"))
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def archived_years(user_id, directory=None):
+    path = _user_dir(user_id, directory)
+    if not os.path.isdir(path):
+        return []
+    names = (name[:-len(".parquet")] for name in os.listdir(path) if name.endswith(".parquet"))
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def _year_files(user_id, start_date, end_date, directory=None):
+    # Files whose year overlaps [start_date, end_date], oldest first
+    first = int(start_date[:4]) if start_date else 0
+    last = int(end_date[:4]) if end_date else 9999
+    return [
+        _year_path(user_id, year, directory)
+        for year in archived_years(user_id, directory) if first <= year <= last
+    ]
+
+
+# Reads
+
+def _filter_expression(start_date, end_date, before=None):
+    # None when nothing needs filtering; `before` is a (date, id) keyset cursor
+    import pyarrow.compute as pc
+    day = pc.field("date")
+    conditions = []
+    if start_date:
+        conditions.append(day >= start_date)
+    if end_date:
+        conditions.append(day <= end_date)
+    if before is not None:
+        conditions.append((day < before[0]) | ((day == before[0]) & (pc.field("id") < int(before[1]))))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _search_mask(table, words):
+    # Mirrors the FTS5 prefix query: every word must start a token in one of
+    # SEARCH_COLUMNS, case-insensitively
+    import pyarrow.compute as pc
+    mask = None
+    for word in words:
+        pattern = r"(^|[^0-9A-Za-z])" + re.escape(word)
+        matches = None
+        for column in SEARCH_COLUMNS:
+            hit = pc.fill_null(pc.match_substring_regex(table[column], pattern, ignore_case=True), False)
+            matches = hit if matches is None else pc.or_(matches, hit)
+        mask = matches if mask is None else pc.and_(mask, matches)
+    return mask
+
+
+def _scan(path, columns, expression, search):
+    import pyarrow.parquet as pq
+    words = (search or "").split()
+    read_columns = list(dict.fromkeys(list(columns) + (SEARCH_COLUMNS if words else [])))
+    table = pq.read_table(path, columns=read_columns, filters=expression, memory_map=True)
+    if words:
+        table = table.filter(_search_mask(table, words))
+    return table.select(list(columns))
+
+
+def _to_frame(tables, columns):
+    # Text NULLs come back as None, not NaN, so `if trade["notes"]` style
+    # checks behave the same for archived rows
+    import pyarrow as pa
+    table = pa.concat_tables(tables) if tables else _schema().empty_table().select(list(columns))
+    frame = table.to_pandas()
+    text = [name for name, alias in ARCHIVE_FIELDS if alias == "string" and name in frame.columns]
+    if text:
+        frame[text] = frame[text].astype(object).where(frame[text].notna(), None)
+    return frame
+
+
+def read_archive(user_id, start_date=None, end_date=None, search="", columns=ARCHIVE_COLUMNS, directory=None):
+    # Archived trades in [start_date, end_date] in (date, id) order. Every
+    # file is sorted and the files are read oldest first, so no sort is needed.
+    expression = _filter_expression(start_date, end_date)
+    tables = [_scan(path, columns, expression, search) for path in _year_files(user_id, start_date, end_date, directory)]
+    return _to_frame(tables, columns)
+
+
+def _row_groups(parquet_file, start_date, end_date):
+    # Row groups whose date statistics overlap [start_date, end_date]
+    date_column = parquet_file.schema_arrow.get_field_index("date")
+    groups = []
+    for number in range(parquet_file.metadata.num_row_groups):
+        stats = parquet_file.metadata.row_group(number).column(date_column).statistics
+        if stats is not None and stats.has_min_max and (
+            (start_date and stats.max < start_date) or (end_date and stats.min > end_date)
+        ):
+            continue
+        groups.append(number)
+    return groups
+
+
+def iter_archive(user_id, start_date=None, end_date=None, search="", columns=ARCHIVE_COLUMNS,
+                 batch_size=1000, directory=None):
+    # Archived trades in [start_date, end_date] in (date, id) order, as tables
+    # of at most batch_size rows; only one batch is held in memory at a time
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    words = (search or "").split()
+    read_columns = list(dict.fromkeys(list(columns) + (SEARCH_COLUMNS if words else [])))
+    expression = _filter_expression(start_date, end_date)
+    for path in _year_files(user_id, start_date, end_date, directory):
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        row_groups = _row_groups(parquet_file, start_date, end_date)
+        if not row_groups:
+            continue
+        for batch in parquet_file.iter_batches(batch_size, row_groups=row_groups, columns=read_columns):
+            table = pa.Table.from_batches([batch])
+            if expression is not None:
+                table = table.filter(expression)
+            if words:
+                table = table.filter(_search_mask(table, words))
+            if len(table):
+                yield table.select(list(columns))
+
+
+def archive_page(user_id, start_date, end_date, search, columns, before=None, limit=26, directory=None):
+    # Up to `limit` archived trades, newest first, older than the `before`
+    # cursor. Years are read newest first and reading stops once the page is full.
+    columns = list(dict.fromkeys(["date", "id"] + list(columns)))
+    expression = _filter_expression(start_date, end_date, before)
+    end_date = min(end_date, before[0]) if before is not None else end_date
+    tables = []
+    remaining = limit
+    for path in reversed(_year_files(user_id, start_date, end_date, directory)):
+        table = _scan(path, columns, expression, search)
+        table = table.slice(max(len(table) - remaining, 0))
+        tables.insert(0, table)
+        remaining -= len(table)
+        if remaining <= 0:
+            break
+    return _to_frame(tables, columns).iloc[::-1].reset_index(drop=True)
+
+
+def archived_screenshots(user_id, trade_id, trade_date, directory=None):
+    # (entry hash, exit hash) of an archived trade, or (None, None)
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    path = _year_path(user_id, trade_date[:4], directory)
+    if not os.path.exists(path):
+        return None, None
+    table = pq.read_table(
+        path, columns=["entry_screenshot", "exit_screenshot"], memory_map=True,
+        filters=(pc.field("date") == trade_date) & (pc.field("id") == int(trade_id))
+    )
+    if not len(table):
+        return None, None
+    row = table.to_pylist()[0]
+    return row["entry_screenshot"], row["exit_screenshot"]
+
+
+# Writes
+
+def _replace_file(path, table):
+    # Swaps the file in with a rename, so readers never see a partial file
+    import pyarrow.parquet as pq
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    pq.write_table(table, temporary, row_group_size=ROW_GROUP_ROWS, compression="zstd")
+    os.replace(temporary, path)
+
+
+def _without_ids(table, ids):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    return table.filter(pc.invert(pc.is_in(table["id"], value_set=pa.array(ids, pa.int64()))))
+
+
+def _write_year(path, table):
+    # Merges with the year's existing file; rows from `table` win
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if os.path.exists(path):
+        existing = pq.read_table(path, schema=_schema())
+        table = pa.concat_tables([_without_ids(existing, table["id"]), table])
+    _replace_file(path, table.sort_by([("date", "ascending"), ("id", "ascending")]))
+
+
+def _discard_unfinished(conn, user_id, directory=None):
+    # Drops the archived copies written by an interrupted run. Those trades
+    # are still in SQLite (or were deleted there since), so the copies are
+    # either duplicates or trades that should be gone; still-eligible trades
+    # are archived again by this run.
+    import pyarrow.parquet as pq
+    pending = {}
+    for year, trade_id in conn.execute("SELECT year, id FROM archive_pending WHERE user_id = ?", (user_id,)):
+        pending.setdefault(year, []).append(trade_id)
+    if not pending:
+        return
+    for year, ids in pending.items():
+        path = _year_path(user_id, year, directory)
+        if not os.path.exists(path):
+            continue
+        table = _without_ids(pq.read_table(path, schema=_schema()), ids)
+        if len(table):
+            _replace_file(path, table)
+        else:
+            os.remove(path)
+    conn.execute("DELETE FROM archive_pending WHERE user_id = ?", (user_id,))
+    conn.commit()
+
+
+def archive_trades(conn, user_id, before_date, directory=None):
+    # Moves the user's closed trades dated before `before_date` into the
+    # archive; returns how many were moved. Each year's ids are recorded in
+    # archive_pending and committed before its Parquet file is written, and
+    # cleared in the transaction that deletes the rows. A run interrupted in
+    # between loses nothing: readers drop archived copies of trades still in
+    # SQLite, and the next run removes those copies from the file.
+    import pyarrow as pa
+    _discard_unfinished(conn, user_id, directory)
+    years = [row[0] for row in conn.execute("""
+        SELECT DISTINCT substr(date, 1, 4) FROM trades
+        WHERE user_id = ? AND date < ? AND status = 'Closed'
+    """, (user_id, before_date))]
+    if not years:
+        return 0
+
+    archived = 0
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archiving (id INTEGER PRIMARY KEY)")
+    for year in sorted(years):
+        rows = conn.execute(f"""
+            SELECT {', '.join(ARCHIVE_COLUMNS)} FROM trades
+            WHERE user_id = ? AND date BETWEEN ? AND ? AND date < ? AND status = 'Closed'
+        """, (user_id, f"{year}-01-01", f"{year}-12-31", before_date)).fetchall()
+        values = list(zip(*rows))
+        table = pa.table(
+            [pa.array(column, field.type) for column, field in zip(values, _schema())],
+            schema=_schema()
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO archive_pending (user_id, year, id) VALUES (?, ?, ?)",
+            ((user_id, year, trade_id) for trade_id in values[0])
+        )
+        conn.commit()
+        _write_year(_year_path(user_id, year, directory), table)
+
+        conn.execute("DELETE FROM temp.archiving")
+        conn.executemany("INSERT INTO temp.archiving (id) VALUES (?)", ((trade_id,) for trade_id in values[0]))
+        conn.execute("""
+            INSERT OR IGNORE INTO archived_blobs (hash, user_id)
+            SELECT entry_screenshot, user_id FROM trades JOIN temp.archiving USING (id)
+            WHERE entry_screenshot IS NOT NULL
+            UNION
+            SELECT exit_screenshot, user_id FROM trades JOIN temp.archiving USING (id)
+            WHERE exit_screenshot IS NOT NULL
+        """)
+        # The user_storage delete trigger subtracts the screenshots, but they
+        # are still stored for the archived trades, so add them back
+        conn.execute("""
+            INSERT INTO user_storage (user_id, screenshot_count, screenshot_bytes)
+            SELECT ?, COUNT(*), COALESCE(SUM(blobs.size), 0)
+            FROM (
+                SELECT entry_screenshot AS hash FROM trades JOIN temp.archiving USING (id)
+                UNION ALL
+                SELECT exit_screenshot FROM trades JOIN temp.archiving USING (id)
+            ) AS refs
+            JOIN blobs ON blobs.hash = refs.hash
+            WHERE true
+            ON CONFLICT (user_id) DO UPDATE SET
+                screenshot_count = screenshot_count + excluded.screenshot_count,
+                screenshot_bytes = screenshot_bytes + excluded.screenshot_bytes
+        """, (user_id,))
+        # The trades stay in daily_pnl
+        with rollup_suspended(conn, user_id):
+            conn.execute("DELETE FROM trades WHERE id IN (SELECT id FROM temp.archiving)")
+        conn.execute("DELETE FROM archive_pending WHERE user_id = ?", (user_id,))
+        conn.commit()
+        archived += len(rows)
+    conn.execute("DROP TABLE temp.archiving")
+    return archived
+
+
+def archive_all(before_date, uri=None, directory=None, user_ids=None):
+    # A session per user and transactions per year, so the write lock is
+    # never held for long.
+    # Returns {user_id: trades archived} for users that had any.
+    if user_ids is None:
+        with session(uri) as conn:
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+    counts = {}
+    for user_id in user_ids:
+        with session(uri) as conn:
+            count = archive_trades(conn, user_id, before_date, directory)
+        if count:
+            counts[user_id] = count
+    return counts
+
+
+# Usage: python archive.py [--days 730 | --before YYYY-MM-DD] [--user NAME]
+#            [--archive-dir DIR] [--database URI] [--vacuum]
+def main():
+    parser = argparse.ArgumentParser(description="Move old closed trades into Parquet cold storage")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive trades older than this many days")
+    parser.add_argument("--before", help="archive trades dated before this day instead (YYYY-MM-DD)")
+    parser.add_argument("--user", help="only this username")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--database", help="database URI (default: DATABASE_URI)")
+    parser.add_argument("--vacuum", action="store_true", help="reclaim the freed space in the database file")
+    args = parser.parse_args()
+
+    before_date = args.before or cutoff_date(args.days)
+    with session(args.database) as conn:
+        migrate(conn)
+        user_ids = None
+        if args.user:
+            row = conn.execute("SELECT id FROM users WHERE username = ?", (args.user,)).fetchone()
+            if row is None:
+                print(f"No user named {args.user}", file=sys.stderr)
+                return 1
+            user_ids = [row[0]]
+    counts = archive_all(before_date, args.database, args.archive_dir, user_ids)
+    for user_id, count in counts.items():
+        print(f"user {user_id}: {count:,} trades archived")
+    print(f"{sum(counts.values()):,} trades dated before {before_date} archived to {args.archive_dir}")
+    if args.vacuum:
+        with session(args.database) as conn:
+            conn.execute("VACUUM")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import hashlib
+import sqlite3
+import pandas as pd
+
+# Account storage and password checks, independent of Streamlit so the
+# benchmarks and CLI tools can call them headless.
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def verify_password(password, hashed_password):
+    return hash_password(password) == hashed_password
+
+
+def authenticate(conn, username, password):
+    # Returns (user_id, is_owner) for valid credentials, otherwise None
+    user = conn.execute("SELECT id, password, is_owner FROM users WHERE username = ?", (username,)).fetchone()
+    if user and verify_password(password, user[1]):
+        return user[0], user[2]
+    return None
+
+
+def create_user(conn, username, password, is_owner=False):
+    # False when the username is taken
+    try:
+        conn.execute(
+            "INSERT INTO users (username, password, is_owner) VALUES (?, ?, ?)",
+            (username, hash_password(password), is_owner)
+        )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+# Owner dashboard: one page of accounts with their activity, keyset
+# paginated on username. Trade stats come from the daily_pnl rollup and
+# screenshot storage from user_storage, so a page is a single grouped query
+# over at most page_size users no matter how many trades they hold.
+USER_PAGE_SIZE = 50
+
+
+def user_page_query(search="", after=None, page_size=USER_PAGE_SIZE):
+    # `search` is a username prefix; `after` is the last username of the previous page
+    conditions = []
+    params = []
+    if search:
+        # Prefix as a range so the unique index on username is used
+        conditions.append("username >= ? AND username < ?")
+        params += [search, search + "\uffff"]
+    if after is not None:
+        conditions.append("username > ?")
+        params.append(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        WITH page AS (
+            SELECT id, username, is_owner FROM users {where}
+            ORDER BY username LIMIT ?
+        )
+        SELECT page.id, page.username, page.is_owner,
+               COALESCE(SUM(daily_pnl.trade_count), 0) AS trade_count,
+               MAX(daily_pnl.date) AS last_trade,
+               COALESCE(SUM(daily_pnl.gross_pnl), 0) AS total_pnl,
+               COALESCE(user_storage.screenshot_count, 0) AS screenshots,
+               COALESCE(user_storage.screenshot_bytes, 0) AS screenshot_bytes
+        FROM page
+        LEFT JOIN daily_pnl ON daily_pnl.user_id = page.id
+        LEFT JOIN user_storage ON user_storage.user_id = page.id
+        GROUP BY page.id
+        ORDER BY page.username
+    """
+    return query, params + [page_size + 1]
+
+
+def fetch_user_page(conn, search="", after=None, page_size=USER_PAGE_SIZE):
+    # Returns (page DataFrame, username to pass as `after` for the next page or None)
+    query, params = user_page_query(search, after, page_size)
+    page_df = pd.read_sql(query, conn, params=params)
+    next_cursor = page_df["username"].iloc[page_size - 1] if len(page_df) > page_size else None
+    return page_df.iloc[:page_size], next_cursor
+
+
+def user_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
@@ -0,0 +1,35 @@
+# Times analytics.trade_metrics on synthetic trade histories.
+# Usage: python benchmarks/bench_analytics.py [--rows 1000000] [--repeat 5]
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import ANALYTICS_COLUMNS, prepare_trades, trade_metrics
+from synthetic import synthetic_trades
+
+BUDGET_MS = 200
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = prepare_trades(synthetic_trades(args.rows)[ANALYTICS_COLUMNS])
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        trade_metrics(df)
+        timings.append((time.perf_counter() - started) * 1000)
+    best = min(timings)
+    print(f"trade_metrics on {args.rows:,} trades: best {best:.1f} ms, median {np.median(timings):.1f} ms")
+    return 0 if args.rows < 1_000_000 or best <= BUDGET_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
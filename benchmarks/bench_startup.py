@@ -0,0 +1,72 @@
+# Cold start: renders the login page in fresh processes and times the first
+# run (which imports the app's modules and sets up the database) and a warm
+# rerun, and checks which heavy libraries the login page pulled in.
+# Usage: python benchmarks/bench_startup.py [--repeat 5]
+# Exits non-zero when the login page imports any of LAZY_MODULES.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+# Only needed by exports, imports, screenshots, charts and the archive
+LAZY_MODULES = ["plotly.express", "openpyxl", "fpdf", "PIL.Image", "pyarrow.parquet"]
+WARM_RERUNS = 5
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_loaded = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+first_render = time.perf_counter()
+warm = []
+for _ in range({reruns}):
+    rerun_started = time.perf_counter()
+    at.run()
+    warm.append(time.perf_counter() - rerun_started)
+print(json.dumps({{
+    "streamlit_import_ms": (streamlit_loaded - started) * 1000,
+    "first_render_ms": (first_render - streamlit_loaded) * 1000,
+    "warm_rerun_ms": sorted(warm)[len(warm) // 2] * 1000,
+    "lazy_loaded": [name for name in {lazy!r} if name in sys.modules],
+    "exceptions": len(at.exception),
+}}))
+"""
+
+
+def probe(directory):
+    # One fresh interpreter against an empty database in `directory`
+    env = dict(os.environ, DATABASE_URI=f"sqlite:///{os.path.join(directory, 'startup.db')}")
+    code = PROBE.format(app=APP, reruns=WARM_RERUNS, lazy=LAZY_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=directory, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            runs.append(probe(directory))
+    report = {
+        key: round(statistics.median(run[key] for run in runs), 1)
+        for key in ("streamlit_import_ms", "first_render_ms", "warm_rerun_ms")
+    }
+    report["lazy_loaded"] = sorted({name for run in runs for name in run["lazy_loaded"]})
+    report["exceptions"] = max(run["exceptions"] for run in runs)
+    print(json.dumps(report, indent=2))
+    return 1 if report["lazy_loaded"] or report["exceptions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# Benchmark suite: builds synthetic databases and times the app's data paths
+# headless, bypassing the query cache so every run hits SQLite.
+# Usage: python benchmarks/run.py [--sizes 1k,100k] [--screenshot-kb 0]
+#            [--output results.json] [--baseline benchmarks/baseline.json]
+#            [--save-baseline] [--threshold 0.25]
+# Exits non-zero when an operation is slower than the baseline by more than
+# the threshold (and by more than NOISE_MS).
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import authenticate
+from charts import calendar_figure
+from db import session
+from exports import export_excel, export_pdf
+from trades import fetch_trade_page, load_daily_pnl, load_trade_metrics, pnl_summary
+from synthetic import PASSWORD, SIZES, generate
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+NOISE_MS = 5.0
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(timings), 3), "min_ms": round(min(timings), 3), "runs": repeat}
+
+
+def operations(uri, user_id, args):
+    today = date.today()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    export_start = (today - timedelta(days=args.export_days)).isoformat()
+    pdf_start = (today - timedelta(days=args.pdf_days)).isoformat()
+    with_images = args.screenshot_kb > 0
+
+    def login():
+        with session(uri) as conn:
+            assert authenticate(conn, "bench_0", PASSWORD)
+
+    def journal_filter():
+        with session(uri) as conn:
+            fetch_trade_page.uncached(conn, user_id, year_ago, today.isoformat(), "")
+
+    def journal_search():
+        with session(uri) as conn:
+            fetch_trade_page.uncached(conn, user_id, year_ago, today.isoformat(), "break")
+
+    def analytics_load():
+        with session(uri) as conn:
+            pnl_summary.uncached(conn, user_id)
+            load_daily_pnl.uncached(conn, user_id)
+            load_trade_metrics.uncached(conn, user_id)
+
+    def calendar():
+        with session(uri) as conn:
+            daily_df = load_daily_pnl.uncached(conn, user_id, year_ago, today.isoformat())
+        calendar_figure(daily_df, year_ago, today.isoformat())
+
+    def excel():
+        with session(uri) as conn:
+            export_excel(conn, user_id, export_start, today.isoformat(), embed_images=with_images)
+
+    def pdf():
+        with session(uri) as conn:
+            export_pdf(conn, user_id, pdf_start, today.isoformat(), include_images=with_images)
+
+    return {
+        "login": (login, args.repeat),
+        "journal_filter": (journal_filter, args.repeat),
+        "journal_search": (journal_search, args.repeat),
+        "analytics_load": (analytics_load, args.repeat),
+        "calendar": (calendar, args.repeat),
+        "excel": (excel, args.export_repeat),
+        "pdf": (pdf, args.export_repeat),
+    }
+
+
+def run_size(label, rows, args, directory):
+    path = os.path.join(directory, f"bench_{label}.db")
+    uri = f"sqlite:///{path}"
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        generate(uri, rows, args.users, args.screenshot_kb, args.distinct_screenshots, args.seed)
+        print(f"[{label}] generated {rows:,} trades in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    with session(uri) as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'bench_0'").fetchone()[0]
+    results = {}
+    for name, (func, repeat) in operations(uri, user_id, args).items():
+        func()  # warm-up: page cache, imports
+        results[name] = timed(func, repeat)
+        print(f"[{label}] {name:15} median {results[name]['median_ms']:10.2f} ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Returns (lines, regression count) for operations present in both runs
+    lines = []
+    regressions = 0
+    for label, operations_ in results.items():
+        for name, current in operations_.items():
+            previous = baseline.get("results", {}).get(label, {}).get(name)
+            if previous is None:
+                continue
+            before, after = previous["median_ms"], current["median_ms"]
+            ratio = after / before if before else float("inf")
+            regressed = ratio > 1 + threshold and after - before > NOISE_MS
+            regressions += regressed
+            lines.append(
+                f"{label:5} {name:15} {before:10.2f} -> {after:10.2f} ms  {ratio:5.2f}x"
+                + ("  REGRESSION" if regressed else "")
+            )
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1k,100k", help=f"comma separated, from {', '.join(SIZES)}")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--screenshot-kb", type=int, default=0)
+    parser.add_argument("--distinct-screenshots", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--export-repeat", type=int, default=1)
+    parser.add_argument("--export-days", type=int, default=90)
+    parser.add_argument("--pdf-days", type=int, default=7)
+    parser.add_argument("--data-dir", help="keep generated databases here and reuse them")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    directory = args.data_dir or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    try:
+        results = {}
+        for label in args.sizes.split(","):
+            results[label] = run_size(label, SIZES[label], args, directory)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "users": args.users,
+            "screenshot_kb": args.screenshot_kb,
+            "export_days": args.export_days,
+            "pdf_days": args.pdf_days,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        lines, regressions = compare(results, json.load(f), args.threshold)
+    print(f"\nCompared with {args.baseline}:", file=sys.stderr)
+    for line in lines:
+        print("  " + line, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# Synthetic users and trades for the benchmarks.
+# Usage: python benchmarks/synthetic.py DB_PATH [--rows 100000] [--users 1]
+#            [--screenshot-kb 0] [--distinct-screenshots 20] [--seed 0]
+import argparse
+import io
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import create_user
+from blob_store import put_blob
+from db import migrate, rebuild_daily_pnl, rollup_suspended, session
+from trades import net_pnl_column
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+PASSWORD = "benchmark"
+YEARS = 5
+INSERT_BATCH = 50_000
+SYMBOLS = ["NIFTY", "BANKNIFTY", "FINNIFTY", "RELIANCE", "TCS", "INFY", "HDFCBANK", "SBIN"]
+NOTE_WORDS = ["gap", "breakout", "pullback", "news", "earnings", "scalp", "swing", "hedge"]
+TRADE_COLUMNS = [
+    "date", "symbol", "trade_type", "entry_price", "exit_price", "stop_loss", "target", "qty",
+    "status", "setup_type", "market_condition", "psychology", "notes", "net_pnl"
+]
+
+
+def synthetic_trades(rows, seed=0, end_date=None, years=YEARS):
+    # Trades spread over `years` up to end_date (default today), date ordered
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end_date or pd.Timestamp.today().normalize())
+    days = np.sort(rng.integers(0, int(years * 365), rows))
+    trade_type = rng.choice(["Long", "Short"], rows)
+    entry = rng.uniform(50, 500, rows).round(2)
+    exit_price = (entry * rng.normal(1.0, 0.02, rows)).round(2)
+    direction = np.where(trade_type == "Long", 1, -1)
+    qty = rng.integers(1, 200, rows)
+    return pd.DataFrame({
+        "date": (end - pd.to_timedelta(int(years * 365) - 1 - days, unit="D")).strftime("%Y-%m-%d"),
+        "symbol": rng.choice(SYMBOLS, rows),
+        "trade_type": trade_type,
+        "entry_price": entry,
+        "exit_price": exit_price,
+        "stop_loss": (entry * (1 - direction * rng.uniform(0.01, 0.05, rows))).round(2),
+        "target": (entry * (1 + direction * rng.uniform(0.02, 0.10, rows))).round(2),
+        "qty": qty,
+        "status": "Closed",
+        "setup_type": rng.choice(["Breakout", "Reversal", "Trend"], rows),
+        "market_condition": rng.choice(["Bullish", "Bearish", "Sideways"], rows),
+        "psychology": rng.choice(["Confident", "Fearful", "Revenge"], rows),
+        "notes": [" ".join(words) for words in rng.choice(NOTE_WORDS, (rows, 3))],
+        "net_pnl": net_pnl_column(trade_type, entry, exit_price, qty).round(2),
+    })
+
+
+def fake_screenshot(size_bytes, seed=0):
+    # Random RGB noise does not compress, so the PNG is close to size_bytes
+    side = max(8, int(np.sqrt(size_bytes / 3)))
+    pixels = np.random.default_rng(seed).integers(0, 256, (side * 9 // 16, side * 16 // 9, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def generate(uri, rows, users=1, screenshot_kb=0, distinct_screenshots=20, seed=0):
+    # Creates users bench_0..bench_{users-1} (password PASSWORD) and splits
+    # `rows` trades between them. Returns the user ids.
+    with session(uri) as conn:
+        migrate(conn)
+    digests = []
+    if screenshot_kb:
+        with session(uri) as conn:
+            cursor = conn.cursor()
+            for number in range(distinct_screenshots):
+                digests.append(put_blob(cursor, fake_screenshot(screenshot_kb * 1024, seed + number)))
+
+    user_ids = []
+    for number in range(users):
+        with session(uri) as conn:
+            create_user(conn, f"bench_{number}", PASSWORD)
+            user_id = conn.execute("SELECT id FROM users WHERE username = ?", (f"bench_{number}",)).fetchone()[0]
+        user_ids.append(user_id)
+        trades_df = synthetic_trades(rows // users + (number < rows % users), seed + number)
+        columns = ["user_id"] + TRADE_COLUMNS
+        if digests:
+            rng = np.random.default_rng(seed + number)
+            trades_df["entry_screenshot"] = rng.choice(digests, len(trades_df))
+            trades_df["exit_screenshot"] = rng.choice(digests, len(trades_df))
+            columns += ["entry_screenshot", "exit_screenshot"]
+        trades_df.insert(0, "user_id", user_id)
+        insert = f"INSERT INTO trades ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        with session(uri) as conn:
+            # Rollup rebuilt once at the end instead of per inserted row
+            with rollup_suspended(conn, user_id):
+                for start in range(0, len(trades_df), INSERT_BATCH):
+                    batch = trades_df.iloc[start:start + INSERT_BATCH][columns].astype(object)
+                    conn.executemany(insert, batch.itertuples(index=False, name=None))
+                rebuild_daily_pnl(conn, user_id)
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db_path")
+    parser.add_argument("--rows", type=int, default=SIZES["100k"])
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--screenshot-kb", type=int, default=0)
+    parser.add_argument("--distinct-screenshots", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    generate(
+        f"sqlite:///{os.path.abspath(args.db_path)}", args.rows, args.users,
+        args.screenshot_kb, args.distinct_screenshots, args.seed
+    )
+    print(f"{args.rows:,} trades for {args.users} users in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import base64
+import hashlib
+
+# Content-addressed store for screenshots. Images are kept once as raw bytes,
+# keyed by their SHA-256; trade rows only hold the hex digest.
+
+HASH_LENGTH = 64
+
+
+def init_blob_store(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL
+    )
+    """)
+
+
+def blob_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def put_blob(cursor, data):
+    if not data:
+        return None
+    digest = blob_hash(data)
+    cursor.execute(
+        "INSERT OR IGNORE INTO blobs (hash, data, size) VALUES (?, ?, ?)",
+        (digest, data, len(data))
+    )
+    return digest
+
+
+def get_blob(cursor, digest):
+    if not digest:
+        return None
+    row = cursor.execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+    return bytes(row[0]) if row else None
+
+
+def put_thumbnail(cursor, digest, data):
+    # Thumbnails live beside the blobs, keyed by the full image's hash
+    cursor.execute(
+        "INSERT OR REPLACE INTO thumbnails (hash, data, size) VALUES (?, ?, ?)",
+        (digest, data, len(data))
+    )
+
+
+def get_thumbnail(cursor, digest):
+    if not digest:
+        return None
+    row = cursor.execute("SELECT data FROM thumbnails WHERE hash = ?", (digest,)).fetchone()
+    return bytes(row[0]) if row else None
+
+
+def prune_blobs(cursor):
+    # Drop every image no trade points at any more; archived trades keep
+    # theirs through archived_blobs. Scans all trades, so it is for
+    # maintenance (see images.py); single deletes use prune_blob_hashes.
+    cursor.execute("""
+        DELETE FROM blobs WHERE hash NOT IN (
+            SELECT entry_screenshot FROM trades WHERE entry_screenshot IS NOT NULL
+            UNION
+            SELECT exit_screenshot FROM trades WHERE exit_screenshot IS NOT NULL
+            UNION
+            SELECT hash FROM archived_blobs
+        )
+    """)
+    pruned = cursor.rowcount
+    cursor.execute("DELETE FROM thumbnails WHERE hash NOT IN (SELECT hash FROM blobs)")
+    return pruned
+
+
+# One image, deleted only if no trade or archived trade still points at it
+PRUNE_HASH_QUERY = """
+    DELETE FROM blobs WHERE hash = :hash
+    AND NOT EXISTS (SELECT 1 FROM trades WHERE entry_screenshot = :hash)
+    AND NOT EXISTS (SELECT 1 FROM trades WHERE exit_screenshot = :hash)
+    AND NOT EXISTS (SELECT 1 FROM archived_blobs WHERE hash = :hash)
+"""
+
+
+def prune_blob_hashes(cursor, hashes):
+    # Like prune_blobs, but only looks at the given images (e.g. those of a
+    # deleted trade), so the cost does not grow with the trades table
+    pruned = 0
+    for digest in {digest for digest in hashes if digest}:
+        cursor.execute(PRUNE_HASH_QUERY, {"hash": digest})
+        if cursor.rowcount:
+            cursor.execute("DELETE FROM thumbnails WHERE hash = ?", (digest,))
+            pruned += 1
+    return pruned
+
+
+def is_blob_reference(value):
+    return isinstance(value, str) and len(value) == HASH_LENGTH and all(
+        ch in "0123456789abcdef" for ch in value
+    )
+
+
+def migrate_base64_screenshots(conn, batch_size=200):
+    # One-time conversion of base64 text columns into blob references.
+    # Rows are walked by id so only one batch of images is in memory at a time.
+    read = conn.cursor()
+    write = conn.cursor()
+    last_id = 0
+    migrated = 0
+    while True:
+        rows = read.execute("""
+            SELECT id, entry_screenshot, exit_screenshot FROM trades
+            WHERE id > ? AND (entry_screenshot IS NOT NULL OR exit_screenshot IS NOT NULL)
+            ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        for trade_id, entry, exit_ in rows:
+            write.execute(
+                "UPDATE trades SET entry_screenshot = ?, exit_screenshot = ? WHERE id = ?",
+                (_to_reference(write, entry), _to_reference(write, exit_), trade_id)
+            )
+            migrated += 1
+        last_id = rows[-1][0]
+        conn.commit()
+    return migrated
+
+
+def _to_reference(cursor, value):
+    if value is None or is_blob_reference(value):
+        return value
+    return put_blob(cursor, base64.b64decode(value))
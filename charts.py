@@ -0,0 +1,91 @@
+import numpy as np
+import plotly.graph_objects as go
+from analytics import WEEKDAYS, calendar_grid
+
+# Plotly figure builders. They return figures rather than rendering them so
+# they can be timed and reused outside the Streamlit script.
+
+
+def calendar_figure(daily_df, start_date, end_date):
+    pnl, text, week_starts = calendar_grid(daily_df, start_date, end_date)
+    fig = go.Figure(go.Heatmap(
+        z=pnl,
+        x=week_starts,
+        y=WEEKDAYS,
+        text=text,
+        hoverinfo="text",
+        colorscale=[[0, "red"], [0.5, "white"], [1, "green"]],
+        zmid=0,
+        xgap=2,
+        ygap=2,
+        colorbar=dict(title="Net P&L")
+    ))
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(height=260, margin=dict(l=10, r=10, t=10, b=10))
+    return fig
+
+
+# Large series are reduced before they reach Plotly: lines are downsampled
+# with LTTB and drawn as WebGL traces, histograms are binned here, and only
+# the x/y arrays of each trace are serialized.
+MAX_LINE_POINTS = 2000
+HISTOGRAM_BINS = 60
+
+
+def lttb(x, y, threshold=MAX_LINE_POINTS):
+    # Largest-Triangle-Three-Buckets: indices of `threshold` points that keep
+    # the visual shape (peaks and troughs) of the series. x must be sorted;
+    # datetime x values are compared as integers.
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = x.astype("datetime64[ns]").astype(np.int64).astype(float) if np.issubdtype(x.dtype, np.datetime64) else x.astype(float)
+    y = np.asarray(y, dtype=float)
+    # Bucket edges over the points between the fixed first and last ones
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Twice the triangle area for each candidate in this bucket
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(area.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+def line_figure(x, y, title, name=None, max_points=MAX_LINE_POINTS, fill=None):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    index = lttb(x, y, max_points)
+    fig = go.Figure(go.Scattergl(x=x[index], y=y[index], mode="lines", name=name, fill=fill))
+    fig.update_layout(title=title)
+    return fig
+
+
+def histogram_figure(values, title, bins=HISTOGRAM_BINS, x_title=None):
+    # Counts per bin computed here; the browser gets bins, not raw values
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return go.Figure(layout=dict(title=title))
+    counts, edges = np.histogram(values, bins=bins)
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate="%{customdata[0]:,.2f} to %{customdata[1]:,.2f}: %{y}<extra></extra>"
+    ))
+    fig.update_layout(title=title, bargap=0, xaxis_title=x_title, yaxis_title="Trades")
+    return fig
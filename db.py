@@ -0,0 +1,492 @@
+import os
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from blob_store import init_blob_store, migrate_base64_screenshots
+from perf import TimedConnection
+
+# Database configuration
+DATABASE_URI = os.environ.get("DATABASE_URI", "sqlite:///trading_data.db")
+
+# Connection pool. Streamlit runs each session on its own thread, so every
+# unit of work checks a connection out of a bounded pool instead of sharing
+# one module-level cursor.
+POOL_SIZE = 8
+MAX_OVERFLOW = 4
+POOL_TIMEOUT = 30
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 20000
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; busy_timeout makes
+    # writers queue on the lock instead of failing with "database is locked"
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.close()
+
+
+def get_engine(uri=None):
+    uri = uri or DATABASE_URI
+    with _engines_lock:
+        engine = _engines.get(uri)
+        if engine is None:
+            engine = create_engine(
+                uri,
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+                # TimedConnection records every statement in perf
+                connect_args={"check_same_thread": False, "factory": TimedConnection},
+            )
+            event.listen(engine, "connect", _configure_connection)
+            _engines[uri] = engine
+    return engine
+
+
+@contextmanager
+def session(uri=None):
+    # One short transaction on a pooled sqlite3 connection: committed when
+    # the block finishes, rolled back if it raises
+    pooled = get_engine(uri).raw_connection()
+    conn = pooled.driver_connection
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pooled.close()
+
+# Schema migrations. The position in MIGRATIONS is the schema version stored
+# in PRAGMA user_version; only the steps past the stored version are applied.
+
+
+def _create_base_tables(conn):
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT,
+        is_owner BOOLEAN DEFAULT FALSE
+    )
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS trades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        date TEXT,
+        symbol TEXT,
+        trade_type TEXT,
+        entry_price REAL,
+        exit_price REAL,
+        stop_loss REAL,
+        target REAL,
+        qty INTEGER,
+        status TEXT,
+        setup_type TEXT,
+        market_condition TEXT,
+        psychology TEXT,
+        notes TEXT,
+        entry_screenshot TEXT,  -- blob hash, see blob_store
+        exit_screenshot TEXT,  -- blob hash, see blob_store
+        net_pnl REAL,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    """)
+    init_blob_store(c)
+    conn.commit()
+
+    # Databases created before the blob store still hold base64 screenshots
+    migrate_base64_screenshots(conn)
+
+
+def _add_trade_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_user_date ON trades (user_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_user_symbol ON trades (user_id, symbol)")
+
+
+def _add_trade_search(conn):
+    # External-content FTS index over the free-text columns, kept in sync by triggers
+    conn.executescript("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS trades_fts USING fts5(
+        symbol, notes, setup_type, psychology,
+        content='trades', content_rowid='id'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trades_fts_insert AFTER INSERT ON trades BEGIN
+        INSERT INTO trades_fts (rowid, symbol, notes, setup_type, psychology)
+        VALUES (new.id, new.symbol, new.notes, new.setup_type, new.psychology);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trades_fts_delete AFTER DELETE ON trades BEGIN
+        INSERT INTO trades_fts (trades_fts, rowid, symbol, notes, setup_type, psychology)
+        VALUES ('delete', old.id, old.symbol, old.notes, old.setup_type, old.psychology);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trades_fts_update
+    AFTER UPDATE OF symbol, notes, setup_type, psychology ON trades BEGIN
+        INSERT INTO trades_fts (trades_fts, rowid, symbol, notes, setup_type, psychology)
+        VALUES ('delete', old.id, old.symbol, old.notes, old.setup_type, old.psychology);
+        INSERT INTO trades_fts (rowid, symbol, notes, setup_type, psychology)
+        VALUES (new.id, new.symbol, new.notes, new.setup_type, new.psychology);
+    END;
+
+    INSERT INTO trades_fts (trades_fts) VALUES ('rebuild');
+    """)
+
+
+# Per-user, per-day P&L rollup. Adding or removing a trade touches its own day
+# and shifts the running total of every later day for that user.
+_ROLLUP_ADD = """
+    INSERT OR IGNORE INTO daily_pnl (user_id, date, cum_pnl)
+    VALUES ({row}.user_id, {row}.date, COALESCE((
+        SELECT cum_pnl FROM daily_pnl
+        WHERE user_id = {row}.user_id AND date < {row}.date
+        ORDER BY date DESC LIMIT 1
+    ), 0));
+    UPDATE daily_pnl SET
+        trade_count = trade_count + 1,
+        win_count = win_count + (COALESCE({row}.net_pnl, 0) > 0),
+        gross_pnl = gross_pnl + COALESCE({row}.net_pnl, 0)
+    WHERE user_id = {row}.user_id AND date = {row}.date;
+    UPDATE daily_pnl SET cum_pnl = cum_pnl + COALESCE({row}.net_pnl, 0)
+    WHERE user_id = {row}.user_id AND date >= {row}.date;
+"""
+
+_ROLLUP_REMOVE = """
+    UPDATE daily_pnl SET
+        trade_count = trade_count - 1,
+        win_count = win_count - (COALESCE({row}.net_pnl, 0) > 0),
+        gross_pnl = gross_pnl - COALESCE({row}.net_pnl, 0)
+    WHERE user_id = {row}.user_id AND date = {row}.date;
+    UPDATE daily_pnl SET cum_pnl = cum_pnl - COALESCE({row}.net_pnl, 0)
+    WHERE user_id = {row}.user_id AND date >= {row}.date;
+    DELETE FROM daily_pnl
+    WHERE user_id = {row}.user_id AND date = {row}.date AND trade_count = 0;
+"""
+
+
+def rebuild_daily_pnl(conn, user_id=None, archive_dir=None):
+    # Recomputes the rollup from the trades table and the Parquet archive
+    # (backfill, or to clear float drift)
+    where = "" if user_id is None else "WHERE user_id = ?"
+    params = () if user_id is None else (user_id,)
+    conn.execute(f"DELETE FROM daily_pnl {where}", params)
+    conn.execute(f"""
+        INSERT INTO daily_pnl (user_id, date, trade_count, win_count, gross_pnl, cum_pnl)
+        SELECT user_id, date, trade_count, win_count, gross_pnl,
+               SUM(gross_pnl) OVER (PARTITION BY user_id ORDER BY date)
+        FROM (
+            SELECT user_id, date, COUNT(*) AS trade_count,
+                   SUM(COALESCE(net_pnl, 0) > 0) AS win_count,
+                   SUM(COALESCE(net_pnl, 0)) AS gross_pnl
+            FROM trades {where}
+            GROUP BY user_id, date
+        )
+    """, params)
+    _add_archived_days(conn, user_id, archive_dir)
+
+
+def _add_archived_days(conn, user_id, archive_dir):
+    # Archived trades are no longer in the trades table, but their days stay
+    # in the rollup; without this a rebuild would drop them from the calendar,
+    # the totals and the trade counts
+    from analytics import daily_summary
+    from archive import archived_user_ids, read_archive  # archive imports db
+    user_ids = archived_user_ids(archive_dir) if user_id is None else [user_id]
+    for archived_user in user_ids:
+        archived = read_archive(archived_user, columns=["id", "date", "net_pnl"], directory=archive_dir)
+        if archived.empty:
+            continue
+        # Copies of trades still in SQLite (an interrupted archive run) were counted above
+        hot = {row[0] for row in conn.execute("SELECT id FROM trades WHERE user_id = ?", (archived_user,))}
+        apply_daily_rows(conn, archived_user, daily_summary(archived[~archived["id"].isin(hot)]))
+
+
+def _add_daily_pnl(conn):
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS daily_pnl (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        trade_count INTEGER NOT NULL DEFAULT 0,
+        win_count INTEGER NOT NULL DEFAULT 0,
+        gross_pnl REAL NOT NULL DEFAULT 0,
+        cum_pnl REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, date)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS daily_pnl_insert AFTER INSERT ON trades BEGIN
+        {_ROLLUP_ADD.format(row="new")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS daily_pnl_delete AFTER DELETE ON trades BEGIN
+        {_ROLLUP_REMOVE.format(row="old")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS daily_pnl_update
+    AFTER UPDATE OF user_id, date, net_pnl ON trades BEGIN
+        {_ROLLUP_REMOVE.format(row="old")}
+        {_ROLLUP_ADD.format(row="new")}
+    END;
+    """)
+    rebuild_daily_pnl(conn)
+
+
+def _add_data_versions(conn):
+    # Per-user counter bumped on every trade write; cached reads are keyed on it
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS data_versions_insert AFTER INSERT ON trades BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (new.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS data_versions_delete AFTER DELETE ON trades BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (old.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS data_versions_update AFTER UPDATE ON trades BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (old.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        INSERT INTO data_versions (user_id, version) VALUES (new.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END;
+    """)
+
+
+_ROLLUP_ACTIVE = "NOT EXISTS (SELECT 1 FROM rollup_suspended WHERE user_id = {row}.user_id)"
+
+
+def _add_rollup_suspension(conn):
+    # Bulk writers insert the user into rollup_suspended inside their own
+    # transaction, write rows without the per-row rollup triggers and then
+    # fold their changes into daily_pnl in one pass (see apply_daily_rows).
+    # The row is removed before commit, so other connections never see it.
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS rollup_suspended (
+        user_id INTEGER PRIMARY KEY
+    );
+
+    DROP TRIGGER IF EXISTS daily_pnl_insert;
+    DROP TRIGGER IF EXISTS daily_pnl_delete;
+    DROP TRIGGER IF EXISTS daily_pnl_update;
+
+    CREATE TRIGGER daily_pnl_insert AFTER INSERT ON trades
+    WHEN {_ROLLUP_ACTIVE.format(row="new")} BEGIN
+        {_ROLLUP_ADD.format(row="new")}
+    END;
+
+    CREATE TRIGGER daily_pnl_delete AFTER DELETE ON trades
+    WHEN {_ROLLUP_ACTIVE.format(row="old")} BEGIN
+        {_ROLLUP_REMOVE.format(row="old")}
+    END;
+
+    CREATE TRIGGER daily_pnl_update AFTER UPDATE OF user_id, date, net_pnl ON trades
+    WHEN {_ROLLUP_ACTIVE.format(row="old")} AND {_ROLLUP_ACTIVE.format(row="new")} BEGIN
+        {_ROLLUP_REMOVE.format(row="old")}
+        {_ROLLUP_ADD.format(row="new")}
+    END;
+    """)
+
+
+@contextmanager
+def rollup_suspended(conn, user_id):
+    conn.execute("INSERT OR IGNORE INTO rollup_suspended (user_id) VALUES (?)", (user_id,))
+    try:
+        yield
+    finally:
+        conn.execute("DELETE FROM rollup_suspended WHERE user_id = ?", (user_id,))
+
+
+def apply_daily_rows(conn, user_id, daily_df, sign=1):
+    # Adds (sign=1) or removes (sign=-1) per-day trade_count/win_count/gross_pnl
+    # totals and recomputes the user's running P&L in one window query
+    if daily_df.empty:
+        return
+    conn.executemany("""
+        INSERT INTO daily_pnl (user_id, date, trade_count, win_count, gross_pnl)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            trade_count = trade_count + excluded.trade_count,
+            win_count = win_count + excluded.win_count,
+            gross_pnl = gross_pnl + excluded.gross_pnl
+    """, [
+        (user_id, day, sign * int(count), sign * int(wins), sign * float(pnl))
+        for day, count, wins, pnl in daily_df[["date", "trade_count", "win_count", "gross_pnl"]].itertuples(index=False)
+    ])
+    conn.execute("DELETE FROM daily_pnl WHERE user_id = ? AND trade_count <= 0", (user_id,))
+    conn.execute("""
+        UPDATE daily_pnl SET cum_pnl = running.cum_pnl
+        FROM (
+            SELECT date, SUM(gross_pnl) OVER (ORDER BY date) AS cum_pnl
+            FROM daily_pnl WHERE user_id = ?
+        ) AS running
+        WHERE daily_pnl.user_id = ? AND daily_pnl.date = running.date
+    """, (user_id, user_id))
+
+
+def _add_option_fields(conn):
+    # Option contracts: entry/exit prices are premiums, so net_pnl stays
+    # (exit - entry) * qty. option_type is 'Call' or 'Put'; implied_vol is
+    # annualized (0.2 = 20%).
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+    for column, kind in (("strike", "REAL"), ("expiry", "TEXT"), ("option_type", "TEXT"), ("implied_vol", "REAL")):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE trades ADD COLUMN {column} {kind}")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trades_open_options ON trades (user_id)
+        WHERE status = 'Open' AND option_type IS NOT NULL
+    """)
+
+
+# Adds (sign=1) or removes (sign=-1) the row's screenshots in user_storage.
+# "WHERE true" keeps the upsert's ON CONFLICT from parsing as a join constraint.
+_STORAGE_DELTA = """
+        INSERT INTO user_storage (user_id, screenshot_count, screenshot_bytes)
+        SELECT {row}.user_id, {sign} * COUNT(*), {sign} * COALESCE(SUM(size), 0)
+        FROM (
+            SELECT size FROM blobs WHERE hash = {row}.entry_screenshot
+            UNION ALL
+            SELECT size FROM blobs WHERE hash = {row}.exit_screenshot
+        ) WHERE true
+        ON CONFLICT (user_id) DO UPDATE SET
+            screenshot_count = screenshot_count + excluded.screenshot_count,
+            screenshot_bytes = screenshot_bytes + excluded.screenshot_bytes;
+"""
+_HAS_SCREENSHOTS = "({row}.entry_screenshot IS NOT NULL OR {row}.exit_screenshot IS NOT NULL)"
+
+
+def _add_user_storage(conn):
+    # Screenshot bytes referenced by each user's trades, for the owner
+    # dashboard. A blob shared by several trades counts once per reference.
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS user_storage (
+        user_id INTEGER PRIMARY KEY,
+        screenshot_count INTEGER NOT NULL DEFAULT 0,
+        screenshot_bytes INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS user_storage_insert AFTER INSERT ON trades
+    WHEN {_HAS_SCREENSHOTS.format(row="new")} BEGIN
+        {_STORAGE_DELTA.format(row="new", sign=1)}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS user_storage_delete AFTER DELETE ON trades
+    WHEN {_HAS_SCREENSHOTS.format(row="old")} BEGIN
+        {_STORAGE_DELTA.format(row="old", sign=-1)}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS user_storage_update
+    AFTER UPDATE OF user_id, entry_screenshot, exit_screenshot ON trades BEGIN
+        {_STORAGE_DELTA.format(row="old", sign=-1)}
+        {_STORAGE_DELTA.format(row="new", sign=1)}
+    END;
+
+    DELETE FROM user_storage;
+    INSERT INTO user_storage (user_id, screenshot_count, screenshot_bytes)
+    SELECT refs.user_id, COUNT(*), SUM(blobs.size)
+    FROM (
+        SELECT user_id, entry_screenshot AS hash FROM trades
+        UNION ALL
+        SELECT user_id, exit_screenshot FROM trades
+    ) AS refs
+    JOIN blobs ON blobs.hash = refs.hash
+    GROUP BY refs.user_id;
+    """)
+
+
+def _add_archived_blobs(conn):
+    # Screenshots referenced by archived trades (see archive.py), so
+    # prune_blobs keeps them after the trade rows leave the database
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archived_blobs (
+        hash TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (hash, user_id)
+    ) WITHOUT ROWID
+    """)
+
+
+def _add_thumbnails(conn):
+    # Small previews of screenshots, keyed by the full image's blob hash.
+    # Older screenshots get theirs on first view or from `python images.py`.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS thumbnails (
+        hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL
+    )
+    """)
+
+
+def _add_archive_pending(conn):
+    # Trades an archive run has written to Parquet but not yet deleted here.
+    # Rows left behind by an interrupted run tell the next run which archived
+    # copies to drop (see archive.py).
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archive_pending (
+        user_id INTEGER NOT NULL,
+        year TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, year, id)
+    ) WITHOUT ROWID
+    """)
+
+
+def _add_screenshot_indexes(conn):
+    # Lets prune_blob_hashes check one image's references without a scan.
+    # Partial, since most trades have no screenshots.
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trades_entry_screenshot ON trades (entry_screenshot)
+        WHERE entry_screenshot IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trades_exit_screenshot ON trades (exit_screenshot)
+        WHERE exit_screenshot IS NOT NULL
+    """)
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_trade_indexes,
+    _add_trade_search,
+    _add_daily_pnl,
+    _add_data_versions,
+    _add_rollup_suspension,
+    _add_option_fields,
+    _add_user_storage,
+    _add_archived_blobs,
+    _add_thumbnails,
+    _add_archive_pending,
+    _add_screenshot_indexes,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    version = schema_version(conn)
+    for number in range(version + 1, len(MIGRATIONS) + 1):
+        MIGRATIONS[number - 1](conn)
+        # PRAGMA does not take bound parameters
+        conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    return schema_version(conn)
@@ -0,0 +1,289 @@
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from blob_store import get_blob
+from perf import timed, timer
+from trades import range_batches
+
+# fpdf, openpyxl and Pillow are imported where they are used: together they
+# take about a third of a second to load, which the login page should not pay.
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+EXCEL_HEADERS = ["Date", "Symbol", "Type", "Entry", "Exit", "Qty", "Status", "Notes", "Net P&L"]
+EXCEL_COLUMNS = [
+    "date", "symbol", "trade_type", "entry_price", "exit_price", "qty",
+    "status", "notes", "net_pnl", "entry_screenshot", "exit_screenshot"
+]
+THUMBNAIL_SIZE = (160, 90)
+
+
+@timed("image_decode_seconds", kind="thumbnail")
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    from PIL import Image as PILImage
+    image = PILImage.open(io.BytesIO(data))
+    image.thumbnail(size)
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+@timed("export_seconds", format="excel")
+def export_excel(conn, user_id, start_date, end_date, search="", embed_images=False, batch_size=1000, progress=None):
+    # Streams trades in [start_date, end_date] from a cursor into a write-only
+    # workbook held in memory. Returns the .xlsx bytes. progress(rows) is
+    # called after each batch and may raise to abandon the export.
+    from openpyxl import Workbook
+    from openpyxl.drawing.image import Image as ExcelImage
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Trade Journal")
+    headers = list(EXCEL_HEADERS)
+    if embed_images:
+        headers += ["Entry Screenshot", "Exit Screenshot"]
+        image_columns = ("J", "K")
+        for column in image_columns:
+            ws.column_dimensions[column].width = THUMBNAIL_SIZE[0] / 7
+        ws.sheet_format.defaultRowHeight = THUMBNAIL_SIZE[1] * 0.75
+        ws.sheet_format.customHeight = True
+    ws.append(headers)
+
+    blobs = conn.cursor()
+    thumbnails = {}
+    row_number = 1
+    try:
+        for batch in range_batches(conn, user_id, start_date, end_date, search, EXCEL_COLUMNS, batch_size):
+            for row in batch:
+                row_number += 1
+                ws.append(row[:len(EXCEL_HEADERS)])
+                if not embed_images:
+                    continue
+                for column, digest in zip(image_columns, row[len(EXCEL_HEADERS):]):
+                    if not digest:
+                        continue
+                    if digest not in thumbnails:
+                        # None when the blob was pruned while the export ran
+                        data = get_blob(blobs, digest)
+                        thumbnails[digest] = make_thumbnail(data) if data is not None else None
+                    if thumbnails[digest] is None:
+                        continue
+                    image = ExcelImage(io.BytesIO(thumbnails[digest]))
+                    ws.add_image(image, f"{column}{row_number}")
+            if progress is not None:
+                progress(len(batch))
+    except BaseException:
+        # Finish the sheet's temporary file so an abandoned export does not
+        # leave openpyxl's row writer to fail during garbage collection
+        ws.close()
+        raise
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+# PDF reports. Screenshots are decoded and downscaled in worker processes and
+# handed to FPDF as in-memory JPEGs; prepared images are cached by blob hash.
+# All exports share one small pool. Its workers are spawned rather than
+# forked, because exports run on threads of the multi-threaded server.
+PDF_COLUMNS = [
+    "date", "symbol", "trade_type", "qty", "entry_price", "exit_price",
+    "net_pnl", "status", "notes", "entry_screenshot", "exit_screenshot"
+]
+# (header, width in mm) for the table columns, in PDF_COLUMNS order
+PDF_TABLE = [
+    ("Date", 22), ("Symbol", 26), ("Type", 13), ("Qty", 12), ("Entry", 20),
+    ("Exit", 20), ("Net P&L", 22), ("Status", 15), ("Notes", 40)
+]
+PDF_IMAGE_PIXELS = 800
+PDF_IMAGE_WIDTH = 90
+PREPARED_CACHE_SIZE = 256
+PARALLEL_MIN_IMAGES = 4
+PDF_IMAGE_WORKERS = int(os.environ.get("PDF_IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+
+_prepared_images = OrderedDict()
+_prepared_lock = threading.Lock()
+_image_pool = []
+
+
+def _get_image_pool():
+    with _prepared_lock:
+        if not _image_pool:
+            _image_pool.append(ProcessPoolExecutor(
+                PDF_IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            ))
+        return _image_pool[0]
+
+
+def _discard_image_pool(pool):
+    # A worker died (e.g. killed for memory); the next export gets a new pool
+    with _prepared_lock:
+        if _image_pool and _image_pool[0] is pool:
+            _image_pool.clear()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def prepare_image(data, max_pixels=PDF_IMAGE_PIXELS):
+    from PIL import Image as PILImage
+    image = PILImage.open(io.BytesIO(data))
+    image.thumbnail((max_pixels, max_pixels))
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=85, optimize=True)
+    return buffer.getvalue(), image.height / image.width
+
+
+def _cached_image(digest):
+    with _prepared_lock:
+        if digest in _prepared_images:
+            _prepared_images.move_to_end(digest)
+            return _prepared_images[digest]
+    return None
+
+
+def _cache_image(digest, prepared):
+    with _prepared_lock:
+        _prepared_images[digest] = prepared
+        _prepared_images.move_to_end(digest)
+        while len(_prepared_images) > PREPARED_CACHE_SIZE:
+            _prepared_images.popitem(last=False)
+
+
+def prepare_images(cursor, digests, pool=None):
+    # Returns {digest: (jpeg bytes, height/width)}, preparing cache misses
+    # in the process pool when there are enough of them to be worth it
+    prepared = {}
+    missing = []
+    for digest in dict.fromkeys(d for d in digests if d):
+        cached = _cached_image(digest)
+        if cached is None:
+            missing.append(digest)
+        else:
+            prepared[digest] = cached
+    # Blobs pruned while the export runs are left out
+    blobs = {digest: get_blob(cursor, digest) for digest in missing}
+    missing = [digest for digest, data in blobs.items() if data is not None]
+    if not missing:
+        return prepared
+    sources = [blobs[digest] for digest in missing]
+    # Decoding may happen in worker processes, so the whole batch is timed here
+    with timer("image_decode_seconds", kind="pdf_batch"):
+        results = None
+        if pool is not None and len(missing) >= PARALLEL_MIN_IMAGES:
+            try:
+                results = list(pool.map(prepare_image, sources))
+            except BrokenProcessPool:
+                _discard_image_pool(pool)
+        if results is None:
+            results = list(map(prepare_image, sources))
+    for digest, result in zip(missing, results):
+        _cache_image(digest, result)
+        prepared[digest] = result
+    return prepared
+
+
+def _pdf_text(value):
+    # Core PDF fonts are latin-1 only
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        value = f"{value:,.2f}"
+    return str(value).encode("latin-1", "replace").decode("latin-1")
+
+
+def _fit_text(pdf, text, width):
+    # Longest prefix that fits in `width` mm: cut where the average character
+    # width says it should, then adjust a character at a time
+    full = pdf.get_string_width(text)
+    if full <= width:
+        return text
+    end = int(len(text) * width / full)
+    while end < len(text) and pdf.get_string_width(text[:end + 1]) <= width:
+        end += 1
+    while end and pdf.get_string_width(text[:end]) > width:
+        end -= 1
+    return text[:end]
+
+
+def _pdf_header(pdf):
+    pdf.set_font("Helvetica", "B", 8)
+    pdf.set_fill_color(230, 230, 230)
+    for header, width in PDF_TABLE:
+        pdf.cell(width, 6, header, border=1, fill=True)
+    pdf.ln()
+    pdf.set_font("Helvetica", size=8)
+
+
+def _pdf_day_summary(pdf, day, count, wins, pnl):
+    pdf.set_font("Helvetica", "B", 8)
+    pdf.cell(
+        sum(width for _, width in PDF_TABLE), 6,
+        _pdf_text(f"{day}: {count} trades, {wins} wins, net P&L {pnl:,.2f}"),
+        border=1
+    )
+    pdf.ln()
+    pdf.set_font("Helvetica", size=8)
+
+
+def _pdf_images(pdf, images):
+    height = max(PDF_IMAGE_WIDTH * ratio for _, ratio in images)
+    if pdf.get_y() + height > pdf.page_break_trigger:
+        pdf.add_page()
+        _pdf_header(pdf)
+    y = pdf.get_y() + 1
+    for index, (data, _) in enumerate(images):
+        pdf.image(io.BytesIO(data), x=pdf.l_margin + index * (PDF_IMAGE_WIDTH + 5), y=y, w=PDF_IMAGE_WIDTH)
+    pdf.set_y(y + height + 2)
+
+
+@timed("export_seconds", format="pdf")
+def export_pdf(conn, user_id, start_date, end_date, search="", include_images=True,
+               daily_summaries=False, batch_size=200, progress=None):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=12)
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 10, "Trade Journal", align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=9)
+    pdf.cell(0, 6, _pdf_text(f"{start_date} to {end_date}"), align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+    _pdf_header(pdf)
+
+    blobs = conn.cursor()
+    day = None
+    day_count = day_wins = 0
+    day_pnl = 0.0
+    for batch in range_batches(conn, user_id, start_date, end_date, search, PDF_COLUMNS, batch_size):
+        images = {}
+        if include_images:
+            # Fetched per batch so a pool replaced after a crash is picked up
+            images = prepare_images(blobs, [d for row in batch for d in row[-2:]], _get_image_pool())
+        for row in batch:
+            if daily_summaries and day is not None and row[0] != day:
+                _pdf_day_summary(pdf, day, day_count, day_wins, day_pnl)
+                day_count = day_wins = 0
+                day_pnl = 0.0
+            day = row[0]
+            pnl = row[6] or 0.0
+            day_count += 1
+            day_wins += pnl > 0
+            day_pnl += pnl
+
+            if pdf.get_y() + 6 > pdf.page_break_trigger:
+                pdf.add_page()
+                _pdf_header(pdf)
+            for value, (_, width) in zip(row, PDF_TABLE):
+                pdf.cell(width, 6, _fit_text(pdf, _pdf_text(value), width - 2), border=1)
+            pdf.ln()
+
+            shots = [images[d] for d in row[-2:] if d in images]
+            if shots:
+                _pdf_images(pdf, shots)
+        if progress is not None:
+            progress(len(batch))
+    if daily_summaries and day is not None:
+        _pdf_day_summary(pdf, day, day_count, day_wins, day_pnl)
+    return bytes(pdf.output())
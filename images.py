@@ -0,0 +1,219 @@
+import argparse
+import io
+import sys
+from blob_store import blob_hash, get_blob, get_thumbnail, prune_blobs, put_blob, put_thumbnail
+from db import migrate, session
+from perf import timed
+
+# Screenshot ingest. Uploads are validated, capped at MAX_IMAGE_SIDE pixels on
+# the long side and re-encoded as WebP before they reach the blob store, and a
+# THUMBNAIL_SIDE preview is stored beside each one (see the thumbnails table).
+# Decoding happens before the write transaction starts, so a large upload
+# never holds the database lock. Pillow is imported on first decode so pages
+# without screenshots do not load it.
+#
+# CLI: python images.py [--recompress] [--batch-size N] [--database URI]
+# backfills thumbnails for existing screenshots; --recompress also re-encodes
+# them and repoints the trades that use them.
+
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_SOURCE_PIXELS = 50_000_000  # refuse decompression bombs before decoding
+MAX_IMAGE_SIDE = 1920
+THUMBNAIL_SIDE = 320
+IMAGE_QUALITY = 82
+THUMBNAIL_QUALITY = 70
+IMAGE_FORMATS = ("PNG", "JPEG", "WEBP")
+UPLOAD_TYPES = ["png", "jpg", "jpeg", "webp"]
+BACKFILL_BATCH = 200
+
+
+def _open(data, draft_size=None):
+    # Decoded, upright image; ValueError for anything that is not a usable
+    # PNG, JPEG or WebP within the size limits. draft_size lets JPEGs decode
+    # straight at a reduced scale.
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format {image.format}; use PNG, JPEG or WebP")
+        if image.width * image.height > MAX_SOURCE_PIXELS:
+            raise ValueError(f"Image is too large ({image.width}x{image.height})")
+        if draft_size is not None:
+            image.draft("RGB", draft_size)
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as error:
+        raise ValueError(f"Not a valid image: {error}") from error
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def _fit(image, side):
+    # Downscaled so the long side is at most `side`; no copy when it already fits
+    from PIL import Image
+    scale = side / max(image.size)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _webp(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+@timed("image_decode_seconds", kind="ingest")
+def transcode(data):
+    # (full image, thumbnail). The original bytes are kept when they are
+    # already within MAX_IMAGE_SIDE and re-encoding would not shrink them.
+    image = _open(data)
+    capped = _fit(image, MAX_IMAGE_SIDE)
+    full = _webp(capped, IMAGE_QUALITY)
+    if capped is image and len(full) >= len(data):
+        full = data
+    # The thumbnail is scaled from the capped image, which is cheaper
+    return full, _webp(_fit(capped, THUMBNAIL_SIDE), THUMBNAIL_QUALITY)
+
+
+@timed("image_decode_seconds", kind="ingest_thumbnail")
+def make_preview(data):
+    image = _open(data, draft_size=(THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+    return _webp(_fit(image, THUMBNAIL_SIDE), THUMBNAIL_QUALITY)
+
+
+def prepare_upload(image_file):
+    # Called before the write transaction; None when nothing was uploaded
+    if image_file is None:
+        return None
+    data = image_file.getvalue()
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"{image_file.name} is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    return transcode(data)
+
+
+def store_image(cursor, prepared):
+    # Stores a prepare_upload result and returns the image's hash
+    if prepared is None:
+        return None
+    full, thumbnail = prepared
+    digest = put_blob(cursor, full)
+    put_thumbnail(cursor, digest, thumbnail)
+    return digest
+
+
+def thumbnail_for(cursor, digest):
+    # Builds and stores the thumbnail of a screenshot saved before ingest
+    # existed; None when there is no image or it cannot be decoded
+    thumbnail = get_thumbnail(cursor, digest)
+    if thumbnail is not None or not digest:
+        return thumbnail
+    data = get_blob(cursor, digest)
+    if data is None:
+        return None
+    try:
+        thumbnail = make_preview(data)
+    except ValueError:
+        return None
+    put_thumbnail(cursor, digest, thumbnail)
+    return thumbnail
+
+
+# Backfill
+
+def _already_ingested(data):
+    # WebP within MAX_IMAGE_SIDE is what ingest produces; re-encoding it
+    # again would only lose quality, one generation per run
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format == "WEBP" and max(image.size) <= MAX_IMAGE_SIDE
+    except (UnidentifiedImageError, OSError):
+        return False
+
+def _remap_screenshots(conn, remap):
+    # Points trades at the re-encoded blobs, one pass per column per batch
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS remap (old TEXT PRIMARY KEY, new TEXT NOT NULL)")
+    conn.execute("DELETE FROM temp.remap")
+    conn.executemany("INSERT INTO temp.remap (old, new) VALUES (?, ?)", remap.items())
+    for column in ("entry_screenshot", "exit_screenshot"):
+        conn.execute(f"""
+            UPDATE trades SET {column} = remap.new
+            FROM temp.remap AS remap WHERE trades.{column} = remap.old
+        """)
+    conn.execute("DROP TABLE temp.remap")
+
+
+def backfill(uri=None, recompress=False, batch_size=BACKFILL_BATCH):
+    # Adds missing thumbnails. With recompress, screenshots that are not yet
+    # WebP within MAX_IMAGE_SIDE are re-encoded and trades are repointed when
+    # that changes them; images referenced by archived trades keep their hash
+    # because the Parquet files store it.
+    stats = {"thumbnails": 0, "recompressed": 0, "bytes_saved": 0, "invalid": 0}
+    with session(uri) as conn:
+        migrate(conn)
+        # (hash, has a thumbnail, referenced by archived trades)
+        digests = conn.execute(f"""
+            SELECT hash, hash IN (SELECT hash FROM thumbnails), hash IN (SELECT hash FROM archived_blobs)
+            FROM blobs
+            {"" if recompress else "WHERE hash NOT IN (SELECT hash FROM thumbnails)"}
+        """).fetchall()
+
+    for start in range(0, len(digests), batch_size):
+        batch = digests[start:start + batch_size]
+        with session(uri) as conn:
+            cursor = conn.cursor()
+            sources = {digest: get_blob(cursor, digest) for digest, _, _ in batch}
+
+        # Decoded between transactions so the write lock is only held for the writes
+        thumbnails = {}
+        images = {}
+        thumbnailed = {digest for digest, has_thumbnail, _ in batch if has_thumbnail}
+        for digest, has_thumbnail, archived in batch:
+            data = sources[digest]
+            try:
+                if recompress and not archived and not _already_ingested(data):
+                    images[digest], thumbnails[digest] = transcode(data)
+                elif not has_thumbnail:
+                    thumbnails[digest] = make_preview(data)
+            except ValueError:
+                stats["invalid"] += 1
+
+        with session(uri) as conn:
+            cursor = conn.cursor()
+            remap = {}
+            for digest, full in images.items():
+                if blob_hash(full) != digest:
+                    remap[digest] = put_blob(cursor, full)
+                    stats["recompressed"] += 1
+                    stats["bytes_saved"] += len(sources[digest]) - len(full)
+            if remap:
+                _remap_screenshots(conn, remap)
+                prune_blobs(cursor)
+            for digest, thumbnail in thumbnails.items():
+                # Originals kept as they were still have their thumbnail
+                if digest in thumbnailed and digest not in remap:
+                    continue
+                put_thumbnail(cursor, remap.get(digest, digest), thumbnail)
+                stats["thumbnails"] += 1
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill screenshot thumbnails")
+    parser.add_argument("--recompress", action="store_true", help="also re-encode and downscale stored screenshots")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH)
+    parser.add_argument("--database", help="database URI (default: DATABASE_URI)")
+    args = parser.parse_args()
+
+    stats = backfill(args.database, args.recompress, args.batch_size)
+    print(
+        f"{stats['thumbnails']:,} thumbnails written, {stats['recompressed']:,} images re-encoded "
+        f"({stats['bytes_saved'] / 1e6:,.1f} MB saved), {stats['invalid']:,} unreadable"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+import argparse
+import re
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+from analytics import daily_summary
+from archive import has_archive, read_archive
+from db import apply_daily_rows, migrate, rollup_suspended, session
+from trades import net_pnl_column
+
+# Bulk import of broker CSV/XLSX exports. Files are read in chunks, mapped
+# onto the trades columns, checked against the stored trades on a natural key
+# (so re-importing a file adds nothing) and written with executemany, one
+# transaction per chunk.
+#
+# CLI: python importer.py FILE --username NAME [--chunk-size N] [--dayfirst]
+#          [--database URI]
+
+CHUNK_ROWS = 50000
+
+# Normalized header -> trades column
+COLUMN_ALIASES = {
+    "date": "date", "trade_date": "date", "entry_date": "date", "order_date": "date",
+    "symbol": "symbol", "tradingsymbol": "symbol", "trading_symbol": "symbol",
+    "scrip": "symbol", "instrument": "symbol", "ticker": "symbol",
+    "type": "trade_type", "trade_type": "trade_type", "side": "trade_type",
+    "direction": "trade_type", "position": "trade_type", "buy_sell": "trade_type",
+    "entry": "entry_price", "entry_price": "entry_price", "avg_entry": "entry_price",
+    "open_price": "entry_price",
+    "exit": "exit_price", "exit_price": "exit_price", "avg_exit": "exit_price",
+    "close_price": "exit_price",
+    "qty": "qty", "quantity": "qty", "shares": "qty",
+    # F&O exports may give lots instead; qty is lots x lot size (see map_columns)
+    "lots": "lots", "no_of_lots": "lots",
+    "lot_size": "lot_size", "lotsize": "lot_size", "market_lot": "lot_size",
+    "stop_loss": "stop_loss", "sl": "stop_loss", "stop": "stop_loss",
+    "target": "target", "tp": "target", "take_profit": "target",
+    "status": "status",
+    "setup_type": "setup_type", "setup": "setup_type", "strategy": "setup_type",
+    "market_condition": "market_condition",
+    "psychology": "psychology", "emotion": "psychology",
+    "notes": "notes", "remarks": "notes", "comment": "notes",
+    "strike": "strike", "strike_price": "strike",
+    "expiry": "expiry", "expiry_date": "expiry", "expiration": "expiry",
+    "option_type": "option_type", "call_put": "option_type", "opt_type": "option_type",
+    "iv": "implied_vol", "implied_vol": "implied_vol", "implied_volatility": "implied_vol",
+}
+
+TRADE_TYPES = {
+    "long": "Long", "buy": "Long", "b": "Long",
+    "short": "Short", "sell": "Short", "s": "Short",
+}
+
+OPTION_TYPES = {"call": "Call", "c": "Call", "ce": "Call", "put": "Put", "p": "Put", "pe": "Put"}
+
+REQUIRED_COLUMNS = ["date", "symbol", "trade_type", "entry_price", "exit_price", "qty"]
+OPTIONAL_COLUMNS = [
+    "stop_loss", "target", "status", "setup_type", "market_condition", "psychology", "notes",
+    "strike", "expiry", "option_type", "implied_vol"
+]
+INSERT_COLUMNS = REQUIRED_COLUMNS + OPTIONAL_COLUMNS + ["net_pnl"]
+# Two rows with the same values here are the same trade
+NATURAL_KEY = [
+    "date", "symbol", "trade_type", "entry_price", "exit_price", "qty",
+    "strike", "expiry", "option_type"
+]
+PRICE_DECIMALS = 6
+
+
+def normalize_header(name):
+    return re.sub(r"[^a-z0-9]+", "_", str(name).strip().lower()).strip("_")
+
+
+def read_chunks(source, filename, chunk_size=CHUNK_ROWS):
+    # `source` is a path or a binary file object; `filename` picks the format
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        yield from _read_excel_chunks(source, chunk_size)
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, skipinitialspace=True)
+
+
+def _read_excel_chunks(source, chunk_size):
+    from openpyxl import load_workbook  # only spreadsheet imports pay for it
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_size:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def map_columns(chunk):
+    renamed = {}
+    for column in chunk.columns:
+        target = COLUMN_ALIASES.get(normalize_header(column))
+        if target and target not in renamed.values():
+            renamed[column] = target
+    df = chunk[list(renamed)].rename(columns=renamed)
+    if "qty" not in df and "lots" in df:
+        if "lot_size" not in df:
+            raise ValueError("A lots column needs a lot size column to give the quantity")
+        df["qty"] = pd.to_numeric(df["lots"], errors="coerce") * pd.to_numeric(df["lot_size"], errors="coerce")
+    missing = [column for column in REQUIRED_COLUMNS if column not in df]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    return df
+
+
+def _parse_dates(values, formats, column, dayfirst=False):
+    # One format per column for the whole file, guessed from its first value
+    # and kept in `formats` across chunks. Dates that do not fit it are
+    # rejected rather than re-read in another order, so 05/03 and 25/03 can
+    # never end up in different months. dayfirst settles values like 05/03
+    # that fit both orders; year-first dates are always read as ISO.
+    if column not in formats:
+        present = values.dropna()
+        if present.empty:
+            return pd.to_datetime(values, errors="coerce")
+        first = present.iloc[0]
+        # Excel cells may already be datetimes, which need no format
+        formats[column] = None
+        if isinstance(first, str):
+            first = first.strip()
+            with warnings.catch_warnings():
+                # An unambiguous day-first value such as 25/03 is fine without dayfirst
+                warnings.simplefilter("ignore", UserWarning)
+                formats[column] = guess_datetime_format(first, dayfirst=dayfirst and not re.match(r"\d{4}", first))
+    return pd.to_datetime(values, errors="coerce", format=formats[column])
+
+
+def normalize_chunk(chunk, formats=None, dayfirst=False):
+    # Returns (clean rows ready to insert, number of rejected rows). Pass the
+    # same `formats` dict for every chunk of a file (see _parse_dates).
+    formats = {} if formats is None else formats
+    df = map_columns(chunk)
+    out = pd.DataFrame(index=df.index)
+    out["date"] = _parse_dates(df["date"], formats, "date", dayfirst).dt.strftime("%Y-%m-%d")
+    out["symbol"] = df["symbol"].astype("string").str.strip().str.upper()
+    out["trade_type"] = df["trade_type"].astype("string").str.strip().str.lower().map(TRADE_TYPES)
+    for column in ("entry_price", "exit_price", "stop_loss", "target", "strike", "implied_vol"):
+        if column in df:
+            out[column] = pd.to_numeric(df[column], errors="coerce").round(PRICE_DECIMALS)
+        else:
+            out[column] = np.nan
+    out["qty"] = pd.to_numeric(df["qty"], errors="coerce").abs()
+    for column in ("setup_type", "market_condition", "psychology", "notes"):
+        out[column] = df[column].astype("string") if column in df else None
+    # Brokers usually quote IV in percent; store it as a decimal
+    out["implied_vol"] = out["implied_vol"].mask(out["implied_vol"] > 3, out["implied_vol"] / 100)
+    if "expiry" in df:
+        out["expiry"] = _parse_dates(df["expiry"], formats, "expiry", dayfirst).dt.strftime("%Y-%m-%d")
+    else:
+        out["expiry"] = None
+    if "option_type" in df:
+        out["option_type"] = df["option_type"].astype("string").str.strip().str.lower().map(OPTION_TYPES)
+    else:
+        out["option_type"] = None
+    if "status" in df:
+        out["status"] = df["status"].astype("string").str.strip().str.capitalize()
+    else:
+        out["status"] = "Closed"
+
+    valid = out[REQUIRED_COLUMNS].notna().all(axis=1) & (out["symbol"] != "") & (out["qty"] > 0)
+    out = out[valid].copy()
+    out["qty"] = out["qty"].astype("int64")
+    out["net_pnl"] = net_pnl_column(out["trade_type"], out["entry_price"], out["exit_price"], out["qty"])
+    return out, int((~valid).sum())
+
+
+def key_hashes(rows):
+    # 64-bit hash of the natural key; file rows and stored rows are cast to
+    # the same dtypes first so equal trades hash equal
+    keys = pd.DataFrame({
+        "date": rows["date"].astype(str),
+        "symbol": rows["symbol"].astype(str),
+        "trade_type": rows["trade_type"].astype(str),
+        "entry_price": rows["entry_price"].astype(float).round(PRICE_DECIMALS),
+        "exit_price": rows["exit_price"].astype(float).round(PRICE_DECIMALS),
+        "qty": rows["qty"].astype("int64"),
+        "strike": rows["strike"].astype(float).fillna(0).round(PRICE_DECIMALS),
+        "expiry": rows["expiry"].fillna("").astype(str),
+        "option_type": rows["option_type"].fillna("").astype(str),
+    })
+    return pd.util.hash_pandas_object(keys, index=False)
+
+
+def existing_key_counts(conn, user_id):
+    # How many stored trades share each natural key hash. Archived trades
+    # count as stored; a trade in both (an interrupted archive run) counts once.
+    existing = pd.read_sql(
+        f"SELECT id, {', '.join(NATURAL_KEY)} FROM trades WHERE user_id = ?", conn, params=(user_id,)
+    )
+    if has_archive(user_id):
+        archived = read_archive(user_id, columns=["id"] + NATURAL_KEY)
+        existing = pd.concat([existing, archived], ignore_index=True).drop_duplicates("id")
+    existing = existing.dropna(subset=REQUIRED_COLUMNS)
+    return key_hashes(existing).value_counts()
+
+
+def _records(user_id, rows):
+    # Plain Python values for sqlite3, with NaN/NA as NULL
+    frame = rows[INSERT_COLUMNS].astype(object).where(rows[INSERT_COLUMNS].notna(), None)
+    for record in frame.itertuples(index=False, name=None):
+        yield (user_id,) + record
+
+
+def import_trades(user_id, source, filename, chunk_size=CHUNK_ROWS, uri=None, progress=None, dayfirst=False):
+    # dayfirst: read ambiguous dates such as 05/03/2024 as DD/MM
+    stats = {"read": 0, "inserted": 0, "duplicates": 0, "rejected": 0}
+    insert = (
+        f"INSERT INTO trades (user_id, {', '.join(INSERT_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in range(len(INSERT_COLUMNS) + 1))})"
+    )
+    with session(uri) as conn:
+        stored = existing_key_counts(conn, user_id)
+    in_file = pd.Series(dtype="int64")  # key hash -> rows seen in earlier chunks
+    formats = {}
+    for chunk in read_chunks(source, filename, chunk_size):
+        rows, rejected = normalize_chunk(chunk, formats, dayfirst)
+        hashes = key_hashes(rows)
+        # Identical fills are real trades: the n-th copy of a key in the file
+        # is only skipped when at least n copies are already stored
+        occurrence = hashes.groupby(hashes).cumcount() + hashes.map(in_file).fillna(0)
+        keep = (occurrence >= hashes.map(stored).fillna(0)).to_numpy()
+        new_rows = rows[keep]
+        with session(uri) as conn:
+            # The daily rollup is updated once per chunk instead of per row
+            with rollup_suspended(conn, user_id):
+                conn.executemany(insert, _records(user_id, new_rows))
+                apply_daily_rows(conn, user_id, daily_summary(new_rows))
+        in_file = in_file.add(hashes.value_counts(), fill_value=0)
+        stats["read"] += len(chunk)
+        stats["rejected"] += rejected
+        stats["duplicates"] += len(rows) - len(new_rows)
+        stats["inserted"] += len(new_rows)
+        if progress is not None:
+            progress(stats)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import trades from a broker CSV/XLSX export.")
+    parser.add_argument("file")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--dayfirst", action="store_true", help="read dates like 05/03/2024 as DD/MM/YYYY")
+    parser.add_argument("--database", help="database URI (default: DATABASE_URI)")
+    args = parser.parse_args(argv)
+
+    with session(args.database) as conn:
+        migrate(conn)
+        user = conn.execute("SELECT id FROM users WHERE username = ?", (args.username,)).fetchone()
+    if user is None:
+        parser.error(f"unknown user {args.username!r}")
+
+    def report(stats):
+        print(f"\r{stats['read']} rows read, {stats['inserted']} inserted", end="", file=sys.stderr)
+
+    stats = import_trades(
+        user[0], args.file, args.file, args.chunk_size, uri=args.database, progress=report, dayfirst=args.dayfirst
+    )
+    print(file=sys.stderr)
+    print(
+        f"Imported {stats['inserted']} trades ({stats['duplicates']} duplicates skipped, "
+        f"{stats['rejected']} invalid rows rejected)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from db import session
+from exports import EXCEL_MIME, export_excel, export_pdf
+from perf import observe
+from query_cache import data_version
+from trades import count_trades
+
+# Background exports. Excel and PDF files are built on a small shared thread
+# pool so a long export neither blocks the session that asked for it nor
+# takes more than EXPORT_WORKERS threads away from everybody else. Each job
+# reports progress per batch and can be cancelled between batches.
+#
+# Finished files are cached by (user, format, range, search, options,
+# data_version): a repeat download of unchanged data is served from memory,
+# and any trade write changes the version so stale files are never reused.
+# Least recently used files are evicted past MAX_RESULT_BYTES; jobs only hold
+# the cache key, so an evicted file has to be exported again.
+
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+MAX_ACTIVE_PER_USER = 2
+MAX_RESULT_BYTES = 256 * 1024 * 1024
+MAX_JOBS = 500
+
+# format -> (export function, MIME type, file extension)
+EXPORT_FORMATS = {
+    "excel": (export_excel, EXCEL_MIME, "xlsx"),
+    "pdf": (export_pdf, "application/pdf", "pdf"),
+}
+ACTIVE = ("queued", "running")
+
+_lock = threading.Lock()
+_jobs = OrderedDict()  # job id -> Job, oldest first
+_results = OrderedDict()  # cache key -> bytes, least recently used first
+_result_stats = {"hits": 0, "misses": 0, "bytes": 0}
+_ids = itertools.count(1)
+_executor = []
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class Job:
+    # status: queued -> running -> done | failed | cancelled
+    __slots__ = ("id", "user_id", "format", "key", "status", "rows_done", "rows_total",
+                 "error", "submitted", "finished", "future", "_cancel")
+
+    def __init__(self, job_id, user_id, export_format, key, rows_total):
+        self.id = job_id
+        self.user_id = user_id
+        self.format = export_format
+        self.key = key
+        self.status = "queued"
+        self.rows_done = 0
+        self.rows_total = rows_total
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def progress(self):
+        # The total comes from the rollup, so a search can finish below 1.0
+        if self.status == "done":
+            return 1.0
+        return min(self.rows_done / self.rows_total, 1.0) if self.rows_total else 0.0
+
+    @property
+    def result(self):
+        # The file bytes, or None once evicted from the result cache
+        return _cached_result(self.key) if self.status == "done" else None
+
+    @property
+    def mime(self):
+        return EXPORT_FORMATS[self.format][1]
+
+    @property
+    def extension(self):
+        return EXPORT_FORMATS[self.format][2]
+
+    def advance(self, rows):
+        # Passed to the exporter as its progress callback
+        if self._cancel.is_set():
+            raise ExportCancelled()
+        self.rows_done += rows
+
+
+def _get_executor():
+    with _lock:
+        if not _executor:
+            _executor.append(ThreadPoolExecutor(EXPORT_WORKERS, thread_name_prefix="export"))
+        return _executor[0]
+
+
+# Result cache
+
+def _cached_result(key):
+    with _lock:
+        data = _results.get(key)
+        if data is not None:
+            _results.move_to_end(key)
+        return data
+
+
+def _store_result(key, data):
+    if len(data) > MAX_RESULT_BYTES:
+        return
+    with _lock:
+        if key in _results:
+            _result_stats["bytes"] -= len(_results.pop(key))
+        _results[key] = data
+        _result_stats["bytes"] += len(data)
+        while _result_stats["bytes"] > MAX_RESULT_BYTES:
+            _, evicted = _results.popitem(last=False)
+            _result_stats["bytes"] -= len(evicted)
+
+
+def export_cache_stats():
+    with _lock:
+        return dict(_result_stats, entries=len(_results))
+
+
+# Jobs
+
+def _run(job, uri, start_date, end_date, search, options):
+    if job._cancel.is_set():
+        job.status = "cancelled"
+        job.finished = time.time()
+        return
+    job.status = "running"
+    observe("export_queue_seconds", time.time() - job.submitted, format=job.format)
+    export = EXPORT_FORMATS[job.format][0]
+    try:
+        with session(uri) as conn:
+            data = export(conn, job.user_id, start_date, end_date, search, progress=job.advance, **options)
+    except ExportCancelled:
+        job.status = "cancelled"
+    except Exception as error:
+        job.error = str(error)
+        job.status = "failed"
+    else:
+        _store_result(job.key, data)
+        job.status = "done"
+    finally:
+        job.finished = time.time()
+
+
+def _register(job):
+    # Caller holds _lock. Forgets the oldest finished jobs past MAX_JOBS.
+    _jobs[job.id] = job
+    finished = (job_id for job_id, old in _jobs.items() if old.status not in ACTIVE)
+    for job_id in list(itertools.islice(finished, max(len(_jobs) - MAX_JOBS, 0))):
+        del _jobs[job_id]
+
+
+def submit_export(user_id, export_format, start_date, end_date, search="", uri=None, **options):
+    # Returns the Job: already done when the file is cached, an identical job
+    # that is still running, or a newly queued one. Returns None when the
+    # user already has MAX_ACTIVE_PER_USER exports in flight.
+    with session(uri) as conn:
+        version = data_version(conn, user_id)
+        rows_total = count_trades(conn, user_id, start_date, end_date)
+    key = (user_id, export_format, start_date, end_date, search, tuple(sorted(options.items())), version)
+    cached = _cached_result(key) is not None
+    with _lock:
+        _result_stats["hits" if cached else "misses"] += 1
+        if cached:
+            job = Job(next(_ids), user_id, export_format, key, rows_total)
+            job.status = "done"
+            job.finished = time.time()
+            _register(job)
+            return job
+        user_jobs = [job for job in _jobs.values() if job.user_id == user_id and job.status in ACTIVE]
+        for job in user_jobs:
+            if job.key == key:
+                return job
+        if len(user_jobs) >= MAX_ACTIVE_PER_USER:
+            return None
+        job = Job(next(_ids), user_id, export_format, key, rows_total)
+        _register(job)
+    job.future = _get_executor().submit(_run, job, uri, start_date, end_date, search, options)
+    return job
+
+
+def get_job(job_id, user_id):
+    # None for unknown (or forgotten) jobs and for other users' jobs
+    with _lock:
+        job = _jobs.get(job_id)
+    return job if job is not None and job.user_id == user_id else None
+
+
+def cancel_job(job_id, user_id):
+    job = get_job(job_id, user_id)
+    if job is None or job.status not in ACTIVE:
+        return False
+    job._cancel.set()
+    if job.future is not None and job.future.cancel():
+        job.status = "cancelled"
+        job.finished = time.time()
+    return True
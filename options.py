@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+
+# Black-Scholes pricing, Greeks and implied volatility for European options.
+# Every function takes scalars or NumPy arrays that broadcast against each
+# other and works on whole arrays, so pricing a large book is a handful of
+# array operations. Time is in years, volatility and rates are annualized
+# decimals; option_type is 'Call' or 'Put'.
+
+RISK_FREE_RATE = 0.065
+DAYS_PER_YEAR = 365.0
+OPTION_TYPES = ["Call", "Put"]
+
+# Implied volatility search bounds and stopping rules
+IV_LOW = 1e-4
+IV_HIGH = 5.0
+IV_TOLERANCE = 1e-8
+IV_MAX_ITERATIONS = 100
+
+# Abramowitz & Stegun 26.2.17 coefficients (absolute error below 7.5e-8)
+_CDF_P = 0.2316419
+_CDF_B = (0.319381530, -0.356563782, 1.781477937, -1.821255978, 1.330274429)
+_INV_SQRT_2PI = 1.0 / np.sqrt(2.0 * np.pi)
+
+
+def norm_pdf(x):
+    return _INV_SQRT_2PI * np.exp(-0.5 * np.square(x))
+
+
+def norm_cdf(x):
+    x = np.asarray(x, dtype=float)
+    t = 1.0 / (1.0 + _CDF_P * np.abs(x))
+    poly = t * (_CDF_B[0] + t * (_CDF_B[1] + t * (_CDF_B[2] + t * (_CDF_B[3] + t * _CDF_B[4]))))
+    upper = 1.0 - norm_pdf(x) * poly
+    return np.where(x >= 0, upper, 1.0 - upper)
+
+
+def is_call(option_type):
+    return np.asarray(option_type) == "Call"
+
+
+def _d1_d2(spot, strike, years, vol, rate):
+    sqrt_t = np.sqrt(years)
+    vol_t = vol * sqrt_t
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * years) / vol_t
+    return d1, d1 - vol_t, sqrt_t
+
+
+def _prepare(spot, strike, years, vol, rate, option_type):
+    spot, strike, years, vol, rate, call = np.broadcast_arrays(
+        np.asarray(spot, dtype=float), np.asarray(strike, dtype=float),
+        np.asarray(years, dtype=float), np.asarray(vol, dtype=float),
+        np.asarray(rate, dtype=float), is_call(option_type)
+    )
+    # Expired contracts (and zero vol) are priced at intrinsic value
+    live = (years > 0) & (vol > 0)
+    return spot, strike, np.where(live, years, 1.0), np.where(live, vol, 1.0), rate, call, live
+
+
+def intrinsic_value(spot, strike, option_type):
+    return np.where(is_call(option_type), np.maximum(spot - strike, 0.0), np.maximum(strike - spot, 0.0))
+
+
+def bs_price(spot, strike, years, vol, rate=RISK_FREE_RATE, option_type="Call"):
+    spot, strike, years, vol, rate, call, live = _prepare(spot, strike, years, vol, rate, option_type)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1, d2, _ = _d1_d2(spot, strike, years, vol, rate)
+        discount = strike * np.exp(-rate * years)
+        call_price = spot * norm_cdf(d1) - discount * norm_cdf(d2)
+        put_price = discount * norm_cdf(-d2) - spot * norm_cdf(-d1)
+    price = np.where(call, call_price, put_price)
+    return np.where(live, price, intrinsic_value(spot, strike, np.where(call, "Call", "Put")))
+
+
+def greeks(spot, strike, years, vol, rate=RISK_FREE_RATE, option_type="Call"):
+    # Per unit of the underlying: delta, gamma, theta per calendar day and
+    # vega per 1 volatility point (0.01)
+    spot, strike, years, vol, rate, call, live = _prepare(spot, strike, years, vol, rate, option_type)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1, d2, sqrt_t = _d1_d2(spot, strike, years, vol, rate)
+        pdf = norm_pdf(d1)
+        discount = strike * np.exp(-rate * years)
+        delta = np.where(call, norm_cdf(d1), norm_cdf(d1) - 1.0)
+        gamma = pdf / (spot * vol * sqrt_t)
+        decay = -spot * pdf * vol / (2.0 * sqrt_t)
+        theta = np.where(call, decay - rate * discount * norm_cdf(d2), decay + rate * discount * norm_cdf(-d2))
+        vega = spot * pdf * sqrt_t
+    expired_delta = np.where(call, (spot > strike) * 1.0, (spot < strike) * -1.0)
+    return {
+        "delta": np.where(live, delta, expired_delta),
+        "gamma": np.where(live, gamma, 0.0),
+        "theta": np.where(live, theta / DAYS_PER_YEAR, 0.0),
+        "vega": np.where(live, vega / 100.0, 0.0),
+    }
+
+
+def _price_and_vega(spot, strike, years, vol, rate, call):
+    # Black-Scholes price and vega (per 1.0 of vol) for live contracts
+    d1, d2, sqrt_t = _d1_d2(spot, strike, years, vol, rate)
+    discount = strike * np.exp(-rate * years)
+    call_price = spot * norm_cdf(d1) - discount * norm_cdf(d2)
+    # Put from put-call parity
+    price = np.where(call, call_price, call_price - spot + discount)
+    return price, spot * norm_pdf(d1) * sqrt_t
+
+
+def implied_volatility(price, spot, strike, years, rate=RISK_FREE_RATE, option_type="Call",
+                       tolerance=IV_TOLERANCE, max_iterations=IV_MAX_ITERATIONS):
+    # Newton-Raphson on all contracts at once, keeping a [low, high] bracket
+    # per contract. Where a Newton step leaves the bracket or vega is too
+    # small, that contract bisects instead. Each iteration only touches the
+    # contracts that have not converged. Prices outside the no-arbitrage
+    # range, or expired contracts, give NaN.
+    shape = np.broadcast_shapes(*(np.shape(a) for a in (price, spot, strike, years, rate, option_type)))
+    price, spot, strike, years, rate, call = (
+        np.ravel(a) for a in np.broadcast_arrays(
+            np.asarray(price, dtype=float), np.asarray(spot, dtype=float),
+            np.asarray(strike, dtype=float), np.asarray(years, dtype=float),
+            np.asarray(rate, dtype=float), is_call(option_type)
+        )
+    )
+    result = np.full(price.shape, np.nan)
+    option_type = np.where(call, "Call", "Put")
+    solvable = (
+        (years > 0)
+        & (price > bs_price(spot, strike, years, IV_LOW, rate, option_type))
+        & (price < bs_price(spot, strike, years, IV_HIGH, rate, option_type))
+    )
+    index = np.flatnonzero(solvable)
+    price, spot, strike, years, rate, call = (a[index] for a in (price, spot, strike, years, rate, call))
+    low = np.full(len(index), IV_LOW)
+    high = np.full(len(index), IV_HIGH)
+    # Brenner-Subrahmanyam starting point, kept inside the bracket
+    vol = np.clip(np.sqrt(2 * np.pi / years) * price / spot, 0.05, 1.0)
+    for _ in range(max_iterations):
+        if not len(index):
+            break
+        model, vega = _price_and_vega(spot, strike, years, vol, rate, call)
+        diff = model - price
+        done = np.abs(diff) <= tolerance
+        if done.any():
+            result[index[done]] = vol[done]
+            keep = ~done
+            index, price, spot, strike, years, rate, call, low, high, vol, diff, vega = (
+                a[keep] for a in (index, price, spot, strike, years, rate, call, low, high, vol, diff, vega)
+            )
+        high = np.where(diff > 0, vol, high)
+        low = np.where(diff < 0, vol, low)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = vol - diff / vega
+        bisect = ~np.isfinite(newton) | (newton <= low) | (newton >= high)
+        vol = np.where(bisect, 0.5 * (low + high), newton)
+    # Contracts still unconverged after max_iterations keep their last estimate
+    result[index] = vol
+    return result.reshape(shape)
+
+
+def years_to_expiry(expiry, as_of):
+    # Calendar days to expiry (inclusive of the expiry day's close) in years
+    days = (pd.to_datetime(pd.Series(expiry)) - pd.Timestamp(as_of)).dt.days.to_numpy(dtype=float)
+    return np.clip(days, 0.0, None) / DAYS_PER_YEAR
+
+
+def position_sign(trade_type):
+    # Long = bought contracts, Short = written contracts
+    return np.where(np.asarray(trade_type) == "Long", 1.0, -1.0)
+
+
+def portfolio_greeks(positions, spots, as_of, rate=RISK_FREE_RATE, default_vol=0.2):
+    # `positions` has symbol, trade_type, qty, strike, expiry, option_type and
+    # implied_vol columns; `spots` maps symbol -> underlying price. Returns
+    # the positions with per-position value and Greeks (signed and scaled by
+    # qty) plus a per-symbol total.
+    df = positions.copy()
+    df["spot"] = df["symbol"].map(spots).astype(float)
+    vol = df["implied_vol"].astype(float).fillna(default_vol).to_numpy()
+    years = years_to_expiry(df["expiry"], as_of)
+    size = position_sign(df["trade_type"]) * df["qty"].to_numpy(dtype=float)
+    spot = df["spot"].to_numpy()
+    strike = df["strike"].to_numpy(dtype=float)
+    option_type = df["option_type"].to_numpy()
+    df["value"] = bs_price(spot, strike, years, vol, rate, option_type) * size
+    for name, values in greeks(spot, strike, years, vol, rate, option_type).items():
+        df[name] = values * size
+    totals = df.groupby("symbol")[["value", "delta", "gamma", "theta", "vega"]].sum().reset_index()
+    return df, totals
+
+
+def payoff_grid(positions, prices):
+    # Expiry P&L of the positions for each underlying price in `prices`:
+    # sum over positions of (intrinsic value - premium paid) * signed qty,
+    # as a (positions x prices) matrix reduced over positions
+    prices = np.asarray(prices, dtype=float)
+    strike = positions["strike"].to_numpy(dtype=float)[:, None]
+    call = is_call(positions["option_type"].to_numpy())[:, None]
+    premium = positions["entry_price"].to_numpy(dtype=float)[:, None]
+    size = (position_sign(positions["trade_type"]) * positions["qty"].to_numpy(dtype=float))[:, None]
+    intrinsic = np.where(call, np.maximum(prices - strike, 0.0), np.maximum(strike - prices, 0.0))
+    return ((intrinsic - premium) * size).sum(axis=0)
+
+
+def price_grid(spot, width=0.3, points=201):
+    return np.linspace(spot * (1 - width), spot * (1 + width), points)
@@ -0,0 +1,283 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# In-process performance metrics. Every series keeps its last WINDOW samples
+# for p50/p95/p99 plus running count/sum/max, and everything can be dumped in
+# the Prometheus text format. SQL is timed by the connection factory the
+# engine passes to sqlite3.connect (see TimedConnection).
+#
+# PERF_METRICS_FILE: rewrite this file with the Prometheus dump at most every
+#     DUMP_INTERVAL seconds (see maybe_dump)
+# PERF_METRICS_PORT: serve the dump over HTTP on this port (any path)
+# PERF_METRICS_HOST: interface to serve it on (default 127.0.0.1; the dump
+#     includes query text, so only bind wider behind a firewall)
+
+PREFIX = "trading_journal_"
+WINDOW = 1000
+QUANTILES = (0.5, 0.95, 0.99)
+MAX_STATEMENTS = 500
+MAX_SESSIONS = 200
+MAX_SQL_CHARS = 400
+DUMP_INTERVAL = 10.0
+METRICS_FILE = os.environ.get("PERF_METRICS_FILE")
+METRICS_PORT = os.environ.get("PERF_METRICS_PORT")
+METRICS_HOST = os.environ.get("PERF_METRICS_HOST", "127.0.0.1")
+
+_lock = threading.Lock()
+_series = {}  # (name, sorted label items) -> _Series
+_statements = OrderedDict()  # query id -> normalized SQL, least recently used first
+_sessions = OrderedDict()  # session id -> stats, least recently updated first
+_last_dump = [0.0]
+_server = []
+
+
+class _Series:
+    __slots__ = ("samples", "count", "total", "max")
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def summary(self):
+        quantiles = np.quantile(np.fromiter(self.samples, float, len(self.samples)), QUANTILES)
+        return dict(zip(("p50", "p95", "p99"), quantiles.tolist()), count=self.count, sum=self.total, max=self.max)
+
+
+def observe(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = _Series()
+        series.add(float(value))
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# SQL timing
+
+def normalize_sql(sql):
+    return " ".join(sql.split())[:MAX_SQL_CHARS]
+
+
+def _query_id(sql):
+    text = normalize_sql(sql)
+    query_id = hashlib.sha1(text.encode()).hexdigest()[:10]
+    with _lock:
+        _statements[query_id] = text
+        _statements.move_to_end(query_id)
+        while len(_statements) > MAX_STATEMENTS:
+            evicted, _ = _statements.popitem(last=False)
+            for key in [key for key in _series if ("query", evicted) in key[1]]:
+                del _series[key]
+    return query_id
+
+
+class TimedCursor(sqlite3.Cursor):
+    # Execute and fetch times are recorded separately under the statement's
+    # query id; SQLite does most of a SELECT's work while rows are fetched
+    _query = None
+
+    def _timed(self, phase, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._query is not None:
+                observe("sql_seconds", time.perf_counter() - started, query=self._query, phase=phase)
+
+    def execute(self, sql, parameters=()):
+        self._query = _query_id(sql)
+        return self._timed("execute", super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._query = _query_id(sql)
+        return self._timed("execute", super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._query = _query_id(sql_script)
+        return self._timed("execute", super().executescript, sql_script)
+
+    def fetchone(self):
+        return self._timed("fetch", super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed("fetch", super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed("fetch", super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    # sqlite3.connect(..., factory=TimedConnection). The execute shortcuts are
+    # routed through cursor() so they are timed too.
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+# Sessions
+
+def record_rerun(session_id, user_id, seconds):
+    observe("rerun_seconds", seconds)
+    with _lock:
+        stats = _sessions.pop(session_id, None) or {"user_id": user_id, "reruns": 0, "total": 0.0, "max": 0.0}
+        stats.update(user_id=user_id, reruns=stats["reruns"] + 1, total=stats["total"] + seconds,
+                     max=max(stats["max"], seconds), last=seconds, updated=time.time())
+        _sessions[session_id] = stats
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+
+
+# Reports
+
+def series_summary():
+    # [{name, labels, count, sum, max, p50, p95, p99}] for every series
+    with _lock:
+        items = [(name, dict(labels), series.summary()) for (name, labels), series in _series.items()]
+    return [dict(summary, name=name, labels=labels) for name, labels, summary in items]
+
+
+def slowest_queries(limit=10):
+    # Statements by total time (execute + fetch), slowest first
+    totals = {}
+    for item in series_summary():
+        if item["name"] != "sql_seconds":
+            continue
+        query = item["labels"]["query"]
+        entry = totals.setdefault(query, {"query": query, "calls": 0, "total_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0})
+        if item["labels"]["phase"] == "execute":
+            entry["calls"] = item["count"]
+        entry["total_ms"] += item["sum"] * 1000
+        entry["p95_ms"] += item["p95"] * 1000
+        entry["max_ms"] = max(entry["max_ms"], item["max"] * 1000)
+    with _lock:
+        for entry in totals.values():
+            entry["sql"] = _statements.get(entry["query"], "")
+    ranked = sorted(totals.values(), key=lambda entry: entry["total_ms"], reverse=True)
+    return ranked[:limit]
+
+
+def slowest_sessions(limit=10):
+    with _lock:
+        sessions = [dict(stats, session=session_id) for session_id, stats in _sessions.items()]
+    return sorted(sessions, key=lambda stats: stats["max"], reverse=True)[:limit]
+
+
+def _label_text(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ") for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+def prometheus_text():
+    # Every series as a Prometheus summary over its sample window
+    lines = []
+    by_name = {}
+    for item in series_summary():
+        by_name.setdefault(item["name"], []).append(item)
+    for name in sorted(by_name):
+        metric = PREFIX + name
+        lines.append(f"# TYPE {metric} summary")
+        for item in by_name[name]:
+            for quantile, key in zip(QUANTILES, ("p50", "p95", "p99")):
+                lines.append(f"{metric}{_label_text(item['labels'], quantile=quantile)} {item[key]:.9g}")
+            lines.append(f"{metric}_sum{_label_text(item['labels'])} {item['sum']:.9g}")
+            lines.append(f"{metric}_count{_label_text(item['labels'])} {item['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path):
+    # Written to a temporary file and renamed so scrapers never see half a dump
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        f.write(prometheus_text())
+    os.replace(temporary, path)
+
+
+def maybe_dump():
+    if not METRICS_FILE:
+        return
+    now = time.monotonic()
+    with _lock:
+        if now - _last_dump[0] < DUMP_INTERVAL:
+            return
+        _last_dump[0] = now
+    write_metrics_file(METRICS_FILE)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host=None):
+    # Idempotent; returns the running server or None when no port is configured
+    port = port or METRICS_PORT
+    host = host or METRICS_HOST
+    if not port:
+        return None
+    with _lock:
+        if not _server:
+            server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _server.append(server)
+        return _server[0]
+
+
+def reset():
+    with _lock:
+        _series.clear()
+        _statements.clear()
+        _sessions.clear()
@@ -0,0 +1,107 @@
+import functools
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+from perf import observe, timer
+
+# In-process cache for per-user reads. Entries are keyed on the user's
+# data_version, which triggers bump on every trade write, so a rerun caused
+# by an unrelated widget is served from memory and any write makes the old
+# entries unreachable. Least recently used entries are evicted once the
+# cached results exceed MAX_CACHE_BYTES.
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+_MISSING = object()
+
+
+def data_version(conn, user_id):
+    row = conn.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def _size_of(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (tuple, list)):
+        return sum(_size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_size_of(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def _lookup(key):
+    with _lock:
+        entry = _entries.get(key, _MISSING)
+        if entry is _MISSING:
+            _stats["misses"] += 1
+            return _MISSING
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry[0]
+
+
+def _rows_of(value):
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(_rows_of(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_rows_of(item) for item in value.values())
+    return 0
+
+
+def _store(key, value, size):
+    if size > MAX_CACHE_BYTES:
+        return
+    with _lock:
+        if key in _entries:
+            _stats["bytes"] -= _entries.pop(key)[1]
+        _entries[key] = (value, size)
+        _stats["bytes"] += size
+        while _stats["bytes"] > MAX_CACHE_BYTES:
+            _, (_, evicted_size) = _entries.popitem(last=False)
+            _stats["bytes"] -= evicted_size
+            _stats["evictions"] += 1
+
+
+def versioned(func):
+    # For read functions called as func(conn, user_id, ...). Cached results
+    # are shared between sessions and must be treated as read-only.
+    @functools.wraps(func)
+    def wrapper(conn, user_id, *args, **kwargs):
+        key = (func.__name__, user_id, _freeze(list(args)), _freeze(kwargs), data_version(conn, user_id))
+        value = _lookup(key)
+        if value is _MISSING:
+            with timer("load_seconds", func=func.__name__):
+                value = func(conn, user_id, *args, **kwargs)
+            size = _size_of(value)
+            observe("loaded_bytes", size, func=func.__name__)
+            observe("loaded_rows", _rows_of(value), func=func.__name__)
+            _store(key, value, size)
+        return value
+
+    wrapper.uncached = func
+    return wrapper
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, entries=len(_entries))
+
+
+def clear_cache():
+    with _lock:
+        _entries.clear()
+        _stats["bytes"] = 0
@@ -0,0 +1,63 @@
+# Confirms the journal filter, owner dashboard and screenshot prune queries are
+# served by indexes rather than table scans.
+# Usage: python scripts/check_query_plans.py
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import user_page_query
+from blob_store import PRUNE_HASH_QUERY
+from db import migrate
+from trades import trade_page_query, range_query
+
+
+# Tables that must never be scanned in full
+LARGE_TABLES = {"trades", "users", "daily_pnl"}
+
+
+def query_plan(conn, query, params):
+    rows = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check(conn, name, query, params, expected):
+    plan = query_plan(conn, query, params)
+    missing = [text for text in expected if not any(text in step for step in plan)]
+    scans = [step for step in plan if step.split()[0] == "SCAN" and step.split()[1] in LARGE_TABLES]
+    ok = not missing and not scans
+    print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    for step in plan:
+        print(f"       {step}")
+    return ok
+
+
+def main():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO trades (user_id, date, symbol, notes, net_pnl) VALUES (?, ?, ?, ?, ?)",
+        [(i % 20, f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", f"SYM{i % 50}", "breakout", 1.0) for i in range(2000)]
+    )
+    conn.executemany("INSERT INTO users (username, password) VALUES (?, 'x')", [(f"user{i}",) for i in range(200)])
+    conn.execute("ANALYZE")
+
+    index = "USING INDEX idx_trades_user_date"
+    fts = "VIRTUAL TABLE INDEX"
+    checks = [
+        ("history page", trade_page_query(3, "2024-01-01", "2024-12-31", ""), [index]),
+        ("history page, next cursor", trade_page_query(3, "2024-01-01", "2024-12-31", "", after=("2024-06-01", 100)), [index]),
+        ("history page, search", trade_page_query(3, "2024-01-01", "2024-12-31", "SYM1"), [index, fts]),
+        ("date range", range_query(3, "2024-01-01", "2024-12-31", ""), [index]),
+        ("date range, search", range_query(3, "2024-01-01", "2024-12-31", "break"), [index, fts]),
+        ("owner user page", user_page_query(after="user10"), ["USING INDEX sqlite_autoindex_users_1", "daily_pnl USING PRIMARY KEY"]),
+        ("owner user page, search", user_page_query("user1"), ["USING INDEX sqlite_autoindex_users_1", "daily_pnl USING PRIMARY KEY"]),
+        ("screenshot prune", (PRUNE_HASH_QUERY, {"hash": "0" * 64}), ["idx_trades_entry_screenshot", "idx_trades_exit_screenshot"]),
+    ]
+    results = [check(conn, name, query, params, expected) for name, (query, params), expected in checks]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# Simulates concurrent Streamlit sessions against the pooled connection layer.
+# Each session thread logs its own trades and reads its history back.
+# Usage: python scripts/load_test.py [--sessions 50] [--trades 40]
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_engine, migrate, session
+from trades import fetch_trade_page, insert_trade
+
+
+def run_session(uri, number, trades_per_session, latencies, errors, barrier):
+    try:
+        with session(uri) as conn:
+            cursor = conn.execute(
+                "INSERT INTO users (username, password) VALUES (?, ?)", (f"load_user_{number}", "x")
+            )
+            user_id = cursor.lastrowid
+        barrier.wait()
+        for i in range(trades_per_session):
+            entry = random.uniform(90, 110)
+            started = time.perf_counter()
+            with session(uri) as conn:
+                insert_trade(conn.cursor(), user_id, {
+                    "date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                    "symbol": random.choice(["NIFTY", "BANKNIFTY", "TCS", "INFY"]),
+                    "trade_type": random.choice(["Long", "Short"]),
+                    "entry_price": entry,
+                    "exit_price": entry + random.uniform(-5, 5),
+                    "qty": random.randint(1, 100),
+                    "status": "Closed",
+                })
+            latencies["write"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            with session(uri) as conn:
+                page_df, _ = fetch_trade_page(conn, user_id, "2024-01-01", "2024-12-31", "")
+            latencies["read"].append(time.perf_counter() - started)
+            if len(page_df) != min(i + 1, 25):
+                raise AssertionError(f"session {number} read {len(page_df)} rows after {i + 1} inserts")
+    except Exception as error:  # reported after all threads finish
+        errors.append(f"session {number}: {error!r}")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--trades", type=int, default=40)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    uri = f"sqlite:///{os.path.join(directory, 'load_test.db')}"
+    with session(uri) as conn:
+        migrate(conn)
+
+    latencies = {"write": [], "read": []}
+    errors = []
+    barrier = threading.Barrier(args.sessions)
+    threads = [
+        threading.Thread(target=run_session, args=(uri, n, args.trades, latencies, errors, barrier))
+        for n in range(args.sessions)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with session(uri) as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+        rollup = conn.execute("SELECT COALESCE(SUM(trade_count), 0) FROM daily_pnl").fetchone()[0]
+
+    expected = args.sessions * args.trades
+    print(f"{args.sessions} sessions x {args.trades} trades in {elapsed:.2f}s")
+    for kind, values in latencies.items():
+        if values:
+            print(
+                f"  {kind:5} n={len(values)} mean={statistics.mean(values) * 1000:.1f}ms "
+                f"p95={percentile(values, 0.95) * 1000:.1f}ms max={max(values) * 1000:.1f}ms"
+            )
+    print(f"  trades stored={stored} expected={expected} rollup={rollup}")
+    print(f"  {get_engine(uri).pool.status()}")
+    for error in errors:
+        print(f"  ERROR {error}")
+    return 0 if not errors and stored == expected == rollup else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
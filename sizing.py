@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Position sizing for any number of entry/stop/target/risk/capital
+# combinations at once. Inputs broadcast against each other like NumPy
+# arrays; a stop equal to the entry gives a quantity of 0 and a NaN R:R
+# instead of dividing by zero.
+
+SCENARIO_COLUMNS = [
+    "symbol", "direction", "entry", "stop", "target", "risk_percent", "capital",
+    "qty", "position_cost", "risk_budget", "trade_risk", "reward_risk"
+]
+
+
+def position_sizes(entry, stop, target, risk_percent, capital):
+    # Returns a dict of broadcast arrays: qty, position_cost, risk_budget
+    # (capital at risk allowed by risk_percent), trade_risk (qty * risk per
+    # share) and reward_risk. Longs have the stop below the entry and shorts
+    # above it; the same formulas cover both.
+    entry, stop, target, risk_percent, capital = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (entry, stop, target, risk_percent, capital))
+    )
+    risk_budget = capital * (risk_percent / 100)
+    risk_per_share = np.abs(entry - stop)
+    valid = risk_per_share > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        qty = np.where(valid, np.round(risk_budget / risk_per_share), 0).astype(np.int64)
+        reward_risk = np.where(valid, (target - entry) / (entry - stop), np.nan)
+    return {
+        "qty": qty,
+        "position_cost": qty * entry,
+        "risk_budget": risk_budget,
+        "trade_risk": qty * risk_per_share,
+        "reward_risk": reward_risk,
+    }
+
+
+def parse_values(text):
+    # "1, 1.5, 2" -> [1.0, 1.5, 2.0]; "start:stop:step" is an inclusive range,
+    # so "1:3:0.5" -> [1.0, 1.5, 2.0, 2.5, 3.0]. Raises ValueError on bad input.
+    values = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            start, stop, step = (float(piece) for piece in part.split(":"))
+            if step <= 0 or stop < start:
+                raise ValueError(f"Invalid range {part!r}")
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            values.extend(np.round(start + step * np.arange(count), 10).tolist())
+        else:
+            values.append(float(part))
+    if not values:
+        raise ValueError("No values given")
+    return values
+
+
+def scenario_matrix(watchlist, risk_percents, capitals):
+    # One row per (watchlist row, risk percent, capital). `watchlist` has
+    # symbol, entry, stop and target columns.
+    watchlist = watchlist.reset_index(drop=True)
+    rows, risks, caps = np.meshgrid(
+        np.arange(len(watchlist)), np.asarray(risk_percents, dtype=float),
+        np.asarray(capitals, dtype=float), indexing="ij"
+    )
+    rows, risks, caps = rows.ravel(), risks.ravel(), caps.ravel()
+    entry = watchlist["entry"].to_numpy(dtype=float)[rows]
+    stop = watchlist["stop"].to_numpy(dtype=float)[rows]
+    target = watchlist["target"].to_numpy(dtype=float)[rows]
+    sizes = position_sizes(entry, stop, target, risks, caps)
+    return pd.DataFrame({
+        "symbol": watchlist["symbol"].to_numpy()[rows],
+        "direction": np.where(stop < entry, "Long", np.where(stop > entry, "Short", "")),
+        "entry": entry,
+        "stop": stop,
+        "target": target,
+        "risk_percent": risks,
+        "capital": caps,
+        **sizes,
+    }, columns=SCENARIO_COLUMNS)
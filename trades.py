@@ -0,0 +1,282 @@
+import heapq
+from itertools import chain, islice
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+from analytics import ANALYTICS_COLUMNS, prepare_trades, trade_metrics
+from archive import archive_page, archived_screenshots, has_archive, iter_archive, read_archive
+from blob_store import get_blob, prune_blob_hashes
+from images import thumbnail_for
+from query_cache import versioned
+
+# Scalar columns shown in the trade history; screenshots are fetched per trade on demand
+HISTORY_COLUMNS = [
+    "id", "date", "symbol", "trade_type", "entry_price", "exit_price",
+    "stop_loss", "target", "qty", "status", "setup_type",
+    "market_condition", "psychology", "notes", "net_pnl",
+    "strike", "expiry", "option_type", "implied_vol"
+]
+
+EXPORT_COLUMNS = [
+    "id", "date", "symbol", "trade_type", "entry_price", "exit_price", "qty",
+    "status", "notes", "net_pnl", "entry_screenshot", "exit_screenshot"
+]
+
+
+def search_expression(text):
+    # Turn the filter box into an FTS5 prefix query: every word must match the
+    # start of a token in symbol, notes, setup_type or psychology.
+    terms = []
+    for word in text.split():
+        terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms)
+
+
+def _filter_clause(user_id, start_date, end_date, search):
+    clause = "user_id = ? AND date BETWEEN ? AND ?"
+    params = [user_id, start_date, end_date]
+    expression = search_expression(search or "")
+    if expression:
+        clause += " AND id IN (SELECT rowid FROM trades_fts WHERE trades_fts MATCH ?)"
+        params.append(expression)
+    return clause, params
+
+
+def trade_page_query(user_id, start_date, end_date, search, after=None, page_size=25):
+    # Keyset pagination on (date, id), newest first. `after` is the (date, id)
+    # of the last row of the previous page.
+    clause, params = _filter_clause(user_id, start_date, end_date, search)
+    query = f"SELECT {', '.join(HISTORY_COLUMNS)} FROM trades WHERE {clause}"
+    if after is not None:
+        query += " AND (date < ? OR (date = ? AND id < ?))"
+        params += [after[0], after[0], after[1]]
+    query += " ORDER BY date DESC, id DESC LIMIT ?"
+    params.append(page_size + 1)
+    return query, params
+
+
+def _union(hot_df, archived_df, ascending=True):
+    # Hot and archived rows in (date, id) order. A trade in both (an archive
+    # run interrupted before its delete committed) keeps the hot row.
+    if archived_df.empty:
+        return hot_df
+    if hot_df.empty:
+        return archived_df
+    union = pd.concat([hot_df, archived_df], ignore_index=True)
+    keys = ["date"]
+    if "id" in union:
+        union = union.drop_duplicates("id")
+        keys.append("id")
+    return union.sort_values(keys, ascending=ascending, kind="stable", ignore_index=True)
+
+
+@versioned
+def fetch_trade_page(conn, user_id, start_date, end_date, search, after=None, page_size=25):
+    # Archived rows come back with archived=True; they cannot be edited
+    query, params = trade_page_query(user_id, start_date, end_date, search, after, page_size)
+    page_df = pd.read_sql(query, conn, params=params).assign(archived=False)
+    if has_archive(user_id):
+        archived_df = archive_page(
+            user_id, start_date, end_date, search, HISTORY_COLUMNS, before=after, limit=page_size + 1
+        )
+        page_df = _union(page_df, archived_df.assign(archived=True), ascending=False)
+    has_more = len(page_df) > page_size
+    page_df = page_df.iloc[:page_size]
+    next_cursor = None
+    if has_more:
+        last = page_df.iloc[-1]
+        next_cursor = (last["date"], int(last["id"]))
+    return page_df, next_cursor
+
+
+def range_query(user_id, start_date, end_date, search, columns=EXPORT_COLUMNS):
+    clause, params = _filter_clause(user_id, start_date, end_date, search)
+    return f"SELECT {', '.join(columns)} FROM trades WHERE {clause} ORDER BY date, id", params
+
+
+@versioned
+def load_trades(conn, user_id, start_date, end_date, search, columns=EXPORT_COLUMNS):
+    query, params = range_query(user_id, start_date, end_date, search, columns)
+    trades_df = pd.read_sql(query, conn, params=params)
+    if has_archive(user_id):
+        trades_df = _union(trades_df, read_archive(user_id, start_date, end_date, search, columns))
+    return trades_df
+
+
+def _archived_rows(conn, user_id, start_date, end_date, search, columns, batch_size):
+    # Archived row tuples for range_batches (columns[0] is id), leaving out
+    # trades that are still in SQLite after an interrupted archive run
+    for table in iter_archive(user_id, start_date, end_date, search, columns, batch_size):
+        ids = table["id"].to_pylist()
+        hot = {row[0] for row in conn.execute(
+            f"SELECT id FROM trades WHERE user_id = ? AND id IN ({', '.join('?' for _ in ids)})",
+            [user_id] + ids
+        )}
+        for row in zip(*(table[column].to_pylist() for column in columns)):
+            if row[0] not in hot:
+                yield row
+
+
+def range_batches(conn, user_id, start_date, end_date, search, columns=EXPORT_COLUMNS, batch_size=1000):
+    # Streams the range as lists of row tuples in (date, id) order, merging
+    # the SQLite cursor with the archive batch by batch; `columns` must include date
+    query, params = range_query(user_id, start_date, end_date, search, ["id"] + columns)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = chain.from_iterable(iter(lambda: cursor.fetchmany(batch_size), []))
+    if has_archive(user_id):
+        archived = _archived_rows(conn, user_id, start_date, end_date, search, ["id"] + columns, batch_size)
+        rows = heapq.merge(rows, archived, key=itemgetter(columns.index("date") + 1, 0))
+    while batch := list(islice(rows, batch_size)):
+        yield [row[1:] for row in batch]
+
+
+def _screenshot_hashes(cursor, trade_id, user_id=None, trade_date=None):
+    # Pass user_id and trade_date to also look in the archive
+    row = cursor.execute(
+        "SELECT entry_screenshot, exit_screenshot FROM trades WHERE id = ?", (trade_id,)
+    ).fetchone()
+    if row is None and user_id is not None:
+        row = archived_screenshots(user_id, trade_id, trade_date)
+    return row if row is not None else (None, None)
+
+
+def fetch_trade_images(conn, trade_id, user_id=None, trade_date=None):
+    cursor = conn.cursor()
+    entry, exit_ = _screenshot_hashes(cursor, trade_id, user_id, trade_date)
+    return get_blob(cursor, entry), get_blob(cursor, exit_)
+
+
+def fetch_trade_thumbnails(conn, trade_id, user_id=None, trade_date=None):
+    # Screenshots saved before thumbnails existed get theirs on first view
+    cursor = conn.cursor()
+    entry, exit_ = _screenshot_hashes(cursor, trade_id, user_id, trade_date)
+    return thumbnail_for(cursor, entry), thumbnail_for(cursor, exit_)
+
+
+def compute_net_pnl(trade_type, entry_price, exit_price, qty):
+    # No brokerage; shorts profit when the exit is below the entry
+    if trade_type == "Long":
+        return (exit_price - entry_price) * qty
+    return (entry_price - exit_price) * qty
+
+
+def net_pnl_column(trade_type, entry_price, exit_price, qty):
+    # Vectorized compute_net_pnl for whole columns
+    return np.where(trade_type == "Long", exit_price - entry_price, entry_price - exit_price) * qty
+
+
+def insert_trade(cursor, user_id, trade):
+    # `trade` maps trades columns to values; net_pnl is derived here.
+    # The daily_pnl rollup is kept current by triggers on the trades table.
+    values = dict(trade, user_id=user_id)
+    values["net_pnl"] = compute_net_pnl(
+        values["trade_type"], values["entry_price"], values["exit_price"], values["qty"]
+    )
+    columns = list(values)
+    cursor.execute(
+        f"INSERT INTO trades ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        [values[column] for column in columns]
+    )
+    return cursor.lastrowid
+
+
+def update_trade(cursor, trade_id, entry_price, exit_price, stop_loss, target, qty, status, notes):
+    cursor.execute("""
+        UPDATE trades SET
+        entry_price = ?,
+        exit_price = ?,
+        stop_loss = ?,
+        target = ?,
+        qty = ?,
+        status = ?,
+        notes = ?,
+        net_pnl = CASE WHEN trade_type = 'Long' THEN (? - ?) * ? ELSE (? - ?) * ? END
+        WHERE id = ?
+    """, (
+        entry_price, exit_price, stop_loss, target, qty, status, notes,
+        exit_price, entry_price, qty,
+        entry_price, exit_price, qty,
+        trade_id
+    ))
+
+
+def delete_trade(cursor, trade_id):
+    screenshots = cursor.execute(
+        "SELECT entry_screenshot, exit_screenshot FROM trades WHERE id=?", (trade_id,)
+    ).fetchone()
+    cursor.execute("DELETE FROM trades WHERE id=?", (trade_id,))
+    if screenshots:
+        prune_blob_hashes(cursor, screenshots)
+
+
+@versioned
+def load_daily_pnl(conn, user_id, start_date=None, end_date=None):
+    query = "SELECT date, trade_count, win_count, gross_pnl, cum_pnl FROM daily_pnl WHERE user_id = ?"
+    params = [user_id]
+    if start_date is not None:
+        query += " AND date BETWEEN ? AND ?"
+        params += [start_date, end_date]
+    return pd.read_sql(query + " ORDER BY date", conn, params=params)
+
+
+def count_trades(conn, user_id, start_date, end_date):
+    # Trades in the range from the rollup (archived trades included)
+    return conn.execute(
+        "SELECT COALESCE(SUM(trade_count), 0) FROM daily_pnl WHERE user_id = ? AND date BETWEEN ? AND ?",
+        (user_id, start_date, end_date)
+    ).fetchone()[0]
+
+
+@versioned
+def trade_date_bounds(conn, user_id):
+    # Separate subqueries so each can use the primary key's min/max shortcut
+    return conn.execute("""
+        SELECT (SELECT MIN(date) FROM daily_pnl WHERE user_id = ?),
+               (SELECT MAX(date) FROM daily_pnl WHERE user_id = ?)
+    """, (user_id, user_id)).fetchone()
+
+
+@versioned
+def pnl_summary(conn, user_id):
+    row = conn.execute("""
+        SELECT COALESCE(SUM(trade_count), 0), COALESCE(SUM(win_count), 0), COALESCE(SUM(gross_pnl), 0)
+        FROM daily_pnl WHERE user_id = ?
+    """, (user_id,)).fetchone()
+    return {"trade_count": row[0], "win_count": row[1], "total_pnl": row[2]}
+
+
+@versioned
+def load_pnl_values(conn, user_id):
+    if not has_archive(user_id):
+        return pd.read_sql("SELECT net_pnl FROM trades WHERE user_id = ?", conn, params=(user_id,))
+    # id and date let _union drop archived copies of trades still in SQLite
+    columns = ["id", "date", "net_pnl"]
+    pnl_df = pd.read_sql(f"SELECT {', '.join(columns)} FROM trades WHERE user_id = ?", conn, params=(user_id,))
+    pnl_df = _union(pnl_df, read_archive(user_id, columns=columns))
+    return pnl_df[["net_pnl"]]
+
+
+@versioned
+def load_open_options(conn, user_id):
+    # Open option positions for the portfolio Greeks and payoff views
+    return pd.read_sql("""
+        SELECT id, symbol, trade_type, entry_price, qty, strike, expiry, option_type, implied_vol
+        FROM trades
+        WHERE user_id = ? AND status = 'Open' AND option_type IS NOT NULL
+        ORDER BY symbol, expiry, strike
+    """, conn, params=(user_id,))
+
+
+@versioned
+def load_trade_metrics(conn, user_id):
+    # Only the columns the metrics need, in the (date, id) order they assume
+    columns = ["id"] + ANALYTICS_COLUMNS
+    trades_df = pd.read_sql(
+        f"SELECT {', '.join(columns)} FROM trades WHERE user_id = ? ORDER BY date, id",
+        conn, params=(user_id,)
+    )
+    if has_archive(user_id):
+        trades_df = _union(trades_df, read_archive(user_id, columns=columns))
+    trades_df = trades_df.drop(columns="id")
+    return trade_metrics(prepare_trades(trades_df))